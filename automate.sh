@@ -12,12 +12,8 @@ source /home/aru/anaconda3/etc/profile.d/conda.sh
 conda activate venv
 
 GITHUB_REPO_URL="add_repo_link"
-OUTPUT_CSV_PATH="add_path_to_output_csv" 
 OUTPUT_SUMMARY_PATH="add_path_to_summary_csv" 
-
-python /home/user/md_file.py "$GITHUB_REPO_URL" "$OUTPUT_CSV_PATH" #replace md_file.py with github_parser.py, python_file.py
-
-python /home/user/summarizer.py "$OUTPUT_CSV_PATH" "$OUTPUT_SUMMARY_PATH"
+GITHUB_CACHE_DIR="/home/user/github_cache" #kept between runs so unchanged files are not downloaded again
 
 source /home/user/anaconda3/etc/profile.d/conda.sh  #replace with path to venv
 conda activate venv
@@ -26,25 +22,23 @@ curl -sSf https://raw.githubusercontent.com/WasmEdge/WasmEdge/master/utils/insta
 
 curl -LO https://huggingface.co/gaianet/Nomic-embed-text-v1.5-Embedding-GGUF/resolve/main/nomic-embed-text-v1.5.f16.gguf
 
-curl -X DELETE 'http://localhost:6333/collections/default'
-
-curl -X PUT 'http://localhost:6333/collections/default' \
-  -H 'Content-Type: application/json' \
-  --data-raw '{
-    "vectors": {
-      "size": 768,
-      "distance": "Cosine",
-      "on_disk": true
-    }
-  }'
+curl -LO https://github.com/LlamaEdge/LlamaEdge/releases/latest/download/llama-api-server.wasm
 
-curl -LO https://github.com/GaiaNet-AI/embedding-tools/raw/main/csv_embed/csv_embed.wasm
-
-wasmedge --dir .:. \
+# Serve the embedding model over an OpenAI-compatible API for the embed stage
+nohup wasmedge --dir .:. \
   --nn-preload embedding:GGML:AUTO:nomic-embed-text-v1.5.f16.gguf \
-  csv_embed.wasm embedding default 768 test_summary.csv --ctx_size 8192
-
-curl -X POST 'http://localhost:6333/collections/default/snapshots'
+  llama-api-server.wasm --model-name nomic-embed-text-v1.5 --prompt-template embedding --ctx-size 8192 --port 8080 &
+EMBEDDING_SERVER_PID=$!
+sleep 10
+
+# Fetch, summarize and embed run concurrently; only new or changed rows are embedded, points of removed files
+# are deleted and a snapshot is taken afterwards. Drop --extensions and --header to ingest every file, as github_parser.py does.
+# The header matches md_file.py so document digests, checkpoints and the LLM cache carry over from earlier runs.
+python /home/user/pipeline.py "$GITHUB_REPO_URL" "$OUTPUT_SUMMARY_PATH" --extensions .md \
+  --header "The following is a markdown document located at" \
+  --cache-dir "$GITHUB_CACHE_DIR" --cache-path /home/user/llm_cache.sqlite --embedding-url http://localhost:8080/v1
+
+kill $EMBEDDING_SERVER_PID
 
 conda deactivate
 
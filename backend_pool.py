@@ -0,0 +1,159 @@
+import openai
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from metrics import metrics
+
+# Matches the old single-endpoint budget: two tenacity attempts with three SDK tries each
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 1
+BACKOFF_MAX = 10
+REQUEST_TIMEOUT = 300
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 30
+HEALTH_INTERVAL = 10
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError, openai.InternalServerError)
+
+class Backend:
+    """One OpenAI-compatible endpoint with a persistent client and its own circuit breaker"""
+
+    def __init__(self, base_url, model, api_key):
+        self.base_url = base_url
+        self.model = model
+        # Retries are handled by the pool so they can move to another backend
+        self.client = openai.OpenAI(base_url=base_url, api_key=api_key, max_retries=0, timeout=REQUEST_TIMEOUT)
+        self.outstanding = 0
+        self.failures = 0
+        # A paused backend gets no traffic until the health check has probed it successfully
+        self.paused = False
+        self.open_until = 0
+
+class BackendPool:
+    """Routes chat completions to the backend with the fewest requests in flight, with retries, circuit breaking and optional hedging"""
+
+    def __init__(self, endpoints, api_key, hedge_after=0, max_attempts=MAX_ATTEMPTS):
+        self.backends = [Backend(base_url, model, api_key) for base_url, model in endpoints]
+        self.hedge_after = hedge_after
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.hedge_executor = ThreadPoolExecutor(max_workers=64) if hedge_after > 0 else None
+        self.cache_model = ",".join(sorted({backend.model for backend in self.backends}))
+        if len(self.backends) > 1:
+            threading.Thread(target=self.health_loop, daemon=True).start()
+
+    def acquire(self, exclude=(), fallback=True):
+        with self.lock:
+            candidates = [backend for backend in self.backends if not backend.paused and backend not in exclude]
+            if not candidates and fallback:
+                candidates = [backend for backend in self.backends if not backend.paused]
+            if not candidates:
+                return None
+            backend = min(candidates, key=lambda candidate: candidate.outstanding)
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend, ok):
+        # ok is None when the request was rejected, which says nothing about the backend's health
+        with self.lock:
+            backend.outstanding -= 1
+            if ok is None:
+                return
+            if ok:
+                backend.failures = 0
+                return
+            backend.failures += 1
+            if backend.failures < FAILURE_THRESHOLD or backend.paused:
+                return
+            # The last healthy backend is never paused, its calls keep retrying with backoff instead
+            if not any(not other.paused for other in self.backends if other is not backend):
+                return
+            backend.paused = True
+            backend.open_until = time.time() + COOLDOWN_SECONDS
+            metrics.inc("llm_circuit_opened_total", backend=backend.base_url)
+            print(f"Backend {backend.base_url} failed {backend.failures} times in a row, pausing it for {COOLDOWN_SECONDS}s")
+
+    def send(self, backend, messages):
+        try:
+            with metrics.timer("llm_request_seconds", backend=backend.base_url):
+                completion = backend.client.chat.completions.create(messages=messages, model=backend.model, stream=False)
+        except RETRYABLE_ERRORS:
+            self.release(backend, False)
+            raise
+        except Exception:
+            self.release(backend, None)
+            raise
+        self.release(backend, True)
+        return completion
+
+    def complete(self, messages):
+        tried = []
+        last_error = None
+        for attempt in range(self.max_attempts):
+            backend = self.acquire(exclude=tried)
+            tried.append(backend)
+            try:
+                if self.hedge_executor is not None:
+                    return self.send_hedged(backend, messages, tried)
+                return self.send(backend, messages)
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+                metrics.inc("llm_retries_total", backend=backend.base_url)
+                print(f"Request to {backend.base_url} failed, retrying: {e}")
+
+            if attempt + 1 < self.max_attempts:
+                # Full jitter keeps many workers from retrying against a recovering backend in lockstep
+                time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+        raise last_error
+
+    def send_hedged(self, backend, messages, tried):
+        # A second copy of a slow request goes to another backend and whichever answers first wins
+        futures = [self.hedge_executor.submit(self.send, backend, messages)]
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            hedge = self.acquire(exclude=tried, fallback=False)
+            if hedge is not None:
+                tried.append(hedge)
+                metrics.inc("llm_hedges_total")
+                futures.append(self.hedge_executor.submit(self.send, hedge, messages))
+
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        metrics.inc("llm_hedges_won_total")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def health_loop(self):
+        # Paused backends get a cheap probe once their cooldown is over, and rejoin only if it succeeds
+        while True:
+            time.sleep(HEALTH_INTERVAL)
+            now = time.time()
+            for backend in self.backends:
+                if not backend.paused or backend.open_until > now:
+                    continue
+                try:
+                    backend.client.models.list()
+                except Exception:
+                    with self.lock:
+                        backend.open_until = time.time() + COOLDOWN_SECONDS
+                    continue
+                with self.lock:
+                    backend.failures = 0
+                    backend.paused = False
+                print(f"Backend {backend.base_url} is healthy again")
+
+def parse_endpoint(value, default_model):
+    # "https://host/v1" or "https://host/v1,model-name"
+    base_url, _, model = value.partition(',')
+    return base_url, model or default_model
+
+def add_backend_arguments(parser):
+    parser.add_argument("--endpoints", nargs='*', default=[], help="OpenAI-compatible base URLs to spread LLM calls over, each optionally followed by ,model (default: the built-in API_BASE_URL)")
+    parser.add_argument("--hedge-after", type=float, default=0, help="Send a second copy of a request to another endpoint if the first has not answered after this many seconds; 0 disables hedging")
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, help="Attempts per LLM call, each on the least busy healthy endpoint")
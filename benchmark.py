@@ -0,0 +1,447 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+OWNER = "bench"
+REPO = "repo"
+BRANCH = "main"
+WORDS = ("pipeline", "summary", "request", "worker", "document", "repository", "cache", "token", "model", "embedding",
+         "parser", "output", "checkpoint", "latency", "throughput", "config", "server", "client", "error", "retry")
+
+class SyntheticRepo:
+    """Deterministic repository of markdown and Python files with a configurable number of files, sizes and nesting"""
+
+    def __init__(self, files=200, file_size=4000, depth=3, fanout=4, seed=1):
+        generator = random.Random(seed)
+        self.files = {}
+        for i in range(files):
+            folders = [f"dir{generator.randrange(fanout)}" for _ in range(generator.randint(0, depth))]
+            extension = generator.choice((".md", ".md", ".py"))
+            path = "/".join(folders + [f"file{i}{extension}"])
+            size = generator.randint(file_size // 2, file_size * 3 // 2)
+            self.files[path] = self.make_content(generator, i, extension, size).encode('utf-8')
+        self.commit = hashlib.sha1(json.dumps(sorted(self.files)).encode('utf-8')).hexdigest()
+
+        # Every folder's listing, keyed by its path, with tree SHAs derived from the paths below it
+        self.folders = {"": {}}
+        for path, data in self.files.items():
+            parts = path.split('/')
+            for depth_index in range(len(parts) - 1):
+                parent, name = "/".join(parts[:depth_index]), parts[depth_index]
+                folder = "/".join(parts[:depth_index + 1])
+                self.folders.setdefault(folder, {})
+                self.folders[parent][name] = ("tree", folder)
+            self.folders["/".join(parts[:-1])][parts[-1]] = ("blob", path)
+        self.tree_shas = {
+            folder: hashlib.sha1(f"tree {folder}\0{sorted(children)}".encode('utf-8')).hexdigest()
+            for folder, children in self.folders.items()
+        }
+        self.folders_by_sha = {sha: folder for folder, sha in self.tree_shas.items()}
+        self.archive = None
+
+    @staticmethod
+    def make_content(generator, index, extension, size):
+        lines = []
+        length = 0
+        while length < size:
+            if extension == ".py":
+                line = f"def {generator.choice(WORDS)}_{index}_{len(lines)}():\n    return '{' '.join(generator.choices(WORDS, k=8))}'\n"
+            elif len(lines) % 8 == 0:
+                line = f"## {generator.choice(WORDS).title()} {len(lines)}\n"
+            else:
+                line = " ".join(generator.choices(WORDS, k=12)) + ".\n"
+            lines.append(line)
+            length += len(line)
+        return "".join(lines)
+
+    @staticmethod
+    def blob_sha(data):
+        return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+    def entry(self, kind, path):
+        if kind == "tree":
+            return {"path": path, "mode": "040000", "type": "tree", "sha": self.tree_shas[path]}
+        return {"path": path, "mode": "100644", "type": "blob", "sha": self.blob_sha(self.files[path]),
+                "size": len(self.files[path])}
+
+    def tree(self, sha, recursive):
+        folder = self.folders_by_sha[sha]
+        prefix = folder + "/" if folder else ""
+        entries = []
+        for name, (kind, path) in sorted(self.folders[folder].items()):
+            entries.append(dict(self.entry(kind, path), path=name))
+            if recursive and kind == "tree":
+                entries.extend(dict(self.entry(sub_kind, sub_path), path=sub_path[len(prefix):])
+                               for sub_kind, sub_path in self.walk(path))
+        return {"sha": sha, "tree": entries, "truncated": False}
+
+    def walk(self, folder):
+        for name, (kind, path) in sorted(self.folders[folder].items()):
+            yield kind, path
+            if kind == "tree":
+                yield from self.walk(path)
+
+    def tarball(self):
+        if self.archive is None:
+            buffer = io.BytesIO()
+            with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+                for path, data in sorted(self.files.items()):
+                    info = tarfile.TarInfo(f"{OWNER}-{REPO}-{self.commit[:7]}/{path}")
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+            self.archive = buffer.getvalue()
+        return self.archive
+
+    def write_to(self, directory):
+        for path, data in self.files.items():
+            file_path = os.path.join(directory, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'wb') as f:
+                f.write(data)
+
+class StubServer:
+    """Threaded HTTP server on a free local port that counts the requests it answers"""
+
+    def __init__(self, handler):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.respond(*handler("GET", self.path, None))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.respond(*handler("POST", self.path, body))
+
+            def respond(self, status, body, content_type="application/json"):
+                with stub.lock:
+                    stub.requests += 1
+                    if status >= 400:
+                        stub.errors += 1
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def counts(self):
+        with self.lock:
+            return self.requests, self.errors
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class FakeGitHub(StubServer):
+    """Serves a SyntheticRepo through the REST endpoints github_ingest uses: repo, commits, git trees, contents, tarball and raw files"""
+
+    def __init__(self, repo, latency=0.0):
+        self.repo = repo
+        self.latency = latency
+        super().__init__(self.handle)
+        self.api_url = self.url + "/api"
+        self.raw_url = self.url + "/raw"
+
+    def handle(self, method, path, body):
+        if self.latency:
+            time.sleep(self.latency)
+        parsed = urlparse(path)
+        query = parse_qs(parsed.query)
+        route = unquote(parsed.path)
+        repo_base = f"/api/repos/{OWNER}/{REPO}"
+        raw_base = f"/raw/{OWNER}/{REPO}/{self.repo.commit}/"
+
+        if route.startswith(raw_base):
+            data = self.repo.files.get(route[len(raw_base):])
+            return (200, data, "text/plain") if data is not None else (404, {"message": "Not Found"})
+        if route == repo_base:
+            return 200, {"default_branch": BRANCH}
+        if route == f"{repo_base}/commits/{BRANCH}":
+            return 200, {"sha": self.repo.commit, "commit": {"tree": {"sha": self.repo.tree_shas[""]}}}
+        if route.startswith(f"{repo_base}/git/trees/"):
+            sha = route.rsplit('/', 1)[-1]
+            if sha not in self.repo.folders_by_sha:
+                return 404, {"message": "Not Found"}
+            return 200, self.repo.tree(sha, "recursive" in query)
+        if route.startswith(f"{repo_base}/contents"):
+            return self.contents(route[len(f"{repo_base}/contents"):].strip('/'))
+        if route in (f"{repo_base}/tarball", f"{repo_base}/tarball/{BRANCH}"):
+            return 200, self.repo.tarball(), "application/gzip"
+        return 404, {"message": "Not Found"}
+
+    def contents(self, folder):
+        if folder not in self.repo.folders:
+            return 404, {"message": "Not Found"}
+        items = []
+        for name, (kind, path) in sorted(self.repo.folders[folder].items()):
+            item = {"name": name, "path": path,
+                    "url": f"{self.api_url}/repos/{OWNER}/{REPO}/contents/{quote(path)}?ref={BRANCH}"}
+            if kind == "tree":
+                item.update(type="dir", sha=self.repo.tree_shas[path], download_url=None)
+            else:
+                item.update(type="file", sha=self.repo.blob_sha(self.repo.files[path]), size=len(self.repo.files[path]),
+                            download_url=f"{self.raw_url}/{OWNER}/{REPO}/{self.repo.commit}/{quote(path)}")
+            items.append(item)
+        return 200, items
+
+class FakeChat(StubServer):
+    """OpenAI-compatible chat completions endpoint with configurable latency, jitter and error rate"""
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, answer_chars=400, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.answer_chars = answer_chars
+        self.generator = random.Random(seed)
+        self.generator_lock = threading.Lock()
+        super().__init__(self.handle)
+        self.api_url = self.url + "/v1"
+
+    def handle(self, method, path, body):
+        if method == "GET" and path.startswith("/v1/models"):
+            return 200, {"object": "list", "data": [{"id": "bench", "object": "model"}]}
+        if method != "POST" or not path.startswith("/v1/chat/completions"):
+            return 404, {"error": {"message": "Not Found"}}
+
+        with self.generator_lock:
+            delay = self.latency + self.generator.uniform(0, self.jitter)
+            failed = self.generator.random() < self.error_rate
+        time.sleep(delay)
+        if failed:
+            return 500, {"error": {"message": "Injected failure", "type": "server_error"}}
+
+        request = json.loads(body)
+        messages = request["messages"]
+        content = self.reply(messages[0]["content"], messages[-1]["content"])
+        prompt_chars = sum(len(message["content"]) for message in messages)
+        return 200, {
+            "id": "bench", "object": "chat.completion", "created": int(time.time()), "model": request["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (prompt_chars + len(content)) // 4},
+        }
+
+    def reply(self, system, user):
+        # Shaped like the replies summarizer.py parses, one branch per prompt it sends
+        text = ("The answer covers " + " ".join(WORDS) + ". ") * (self.answer_chars // 150 + 1)
+        text = text[:self.answer_chars]
+        if "list of 10 questions" in system:
+            return "\n".join(f"What does part {i} of the document describe?" for i in range(1, 11))
+        if "=== DOCUMENT" in user:
+            count = user.count("=== END DOCUMENT")
+            return json.dumps([{"document": i, "summary": text, "qna": [{"question": "What is it?", "answer": text}]}
+                               for i in range(1, count + 1)])
+        if "JSON array of strings" in system:
+            return json.dumps([text] * len(json.loads(user)))
+        return text
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def fetch_stage(options):
+    import github_ingest
+    github_ingest.GITHUB_API_URL = options["api_url"]
+    github_ingest.GITHUB_RAW_URL = options["raw_url"]
+    repo_url = f"https://github.com/{OWNER}/{REPO}/tree/{BRANCH}"
+    count = 0
+    for _ in github_ingest.iter_ingest(repo_url, [], github_ingest.DEFAULT_HEADER, options["mode"], options["workers"]):
+        count += 1
+    return count, 0
+
+def parse_stage(options):
+    from local_parser import process_local_repo
+    count = 0
+    for _ in process_local_repo(options["directory"], max_workers=options["workers"]):
+        count += 1
+    return count, 0
+
+def summarize_stage(options):
+    import summarizer
+    from backend_pool import BackendPool
+    from github_ingest import DEFAULT_HEADER, format_document
+    summarizer.backend_pool = BackendPool([(options["chat_url"], "bench")], "bench", options["hedge_after"],
+                                          options["max_attempts"])
+    documents = [format_document(DEFAULT_HEADER, path, data.decode('utf-8'))
+                 for path, data in list(options["repo"].files.items())[:options["rows"]]]
+
+    def process(document):
+        try:
+            summarizer.process_row(document, options["answer_workers"], options["batch_answers"])
+            return True
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+        results = list(executor.map(process, documents))
+    return results.count(True), results.count(False)
+
+STAGES = {"fetch": fetch_stage, "parse": parse_stage, "summarize": summarize_stage}
+
+def stage_worker(name, options, results, verbose):
+    # Each stage runs in a fresh process so its peak RSS is not inflated by the stages before it
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    output = sys.stdout if verbose else open(os.devnull, 'w')
+    with contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        items, failed = STAGES[name](options)
+        seconds = time.perf_counter() - start
+    results.put({"items": items, "failed": failed, "seconds": seconds, "peak_rss_mb": peak_rss_mb()})
+
+def run_stage(label, name, options, server, verbose):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    requests_before, errors_before = server.counts() if server else (0, 0)
+    process = context.Process(target=stage_worker, args=(name, options, results, verbose))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"Stage {label} exited with code {process.exitcode}")
+    process.join()
+    requests_after, errors_after = server.counts() if server else (0, 0)
+
+    result["stage"] = label
+    result["requests"] = requests_after - requests_before
+    result["server_errors"] = errors_after - errors_before
+    result["items_per_second"] = result["items"] / result["seconds"] if result["seconds"] else 0
+    result["requests_per_item"] = result["requests"] / result["items"] if result["items"] else 0
+    return result
+
+def print_report(results):
+    print(f"{'stage':<16}{'items':>8}{'failed':>8}{'seconds':>10}{'items/s':>10}{'requests':>10}{'req/item':>10}{'peak RSS MB':>13}")
+    for result in results:
+        print(f"{result['stage']:<16}{result['items']:>8}{result['failed']:>8}{result['seconds']:>10.2f}"
+              f"{result['items_per_second']:>10.1f}{result['requests']:>10}{result['requests_per_item']:>10.2f}"
+              f"{result['peak_rss_mb']:>13.1f}")
+
+def compare_baseline(results, baseline_path, tolerance):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result["stage"]: result for result in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["stage"])
+        if previous is None:
+            continue
+        if result["items_per_second"] < previous["items_per_second"] * (1 - tolerance):
+            regressions.append(f"{result['stage']}: {result['items_per_second']:.1f} items/s, baseline {previous['items_per_second']:.1f}")
+        if result["requests_per_item"] > previous["requests_per_item"] * (1 + tolerance):
+            regressions.append(f"{result['stage']}: {result['requests_per_item']:.2f} requests/item, baseline {previous['requests_per_item']:.2f}")
+        if result["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{result['stage']}: {result['peak_rss_mb']:.1f} MB peak RSS, baseline {previous['peak_rss_mb']:.1f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fetch, parse and summarize stages against local stand-ins for GitHub and the inference API.")
+    parser.add_argument("--stages", nargs='*', choices=sorted(STAGES), default=["fetch", "parse", "summarize"], help="Stages to run")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the synthetic repository and the injected latency and errors")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the code being benchmarked")
+
+    repo = parser.add_argument_group("synthetic repository")
+    repo.add_argument("--files", type=int, default=500, help="Number of files")
+    repo.add_argument("--file-size", type=int, default=4000, help="Average file size in bytes")
+    repo.add_argument("--depth", type=int, default=3, help="Maximum folder nesting")
+    repo.add_argument("--fanout", type=int, default=4, help="Folders to choose from at each level")
+
+    fetch = parser.add_argument_group("fetch and parse")
+    fetch.add_argument("--modes", nargs='*', choices=["tree", "contents", "archive"], default=["tree", "contents", "archive"], help="GitHub listing modes to benchmark")
+    fetch.add_argument("--fetch-workers", type=int, default=8, help="Concurrent downloads or file reads")
+    fetch.add_argument("--github-latency", type=float, default=0.0, help="Seconds the fake GitHub server waits before each response")
+
+    summarize = parser.add_argument_group("summarize")
+    summarize.add_argument("--rows", type=int, default=50, help="Number of files summarized")
+    summarize.add_argument("--summarize-workers", type=int, default=4, help="Rows summarized concurrently")
+    summarize.add_argument("--answer-workers", type=int, default=1, help="LLM calls run concurrently within a row")
+    summarize.add_argument("--batch-answers", action="store_true", help="Answer all questions of a row in a single request")
+    summarize.add_argument("--llm-latency", type=float, default=0.05, help="Base seconds the fake inference server takes per request")
+    summarize.add_argument("--llm-jitter", type=float, default=0.0, help="Extra random latency of up to this many seconds per request")
+    summarize.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500 error")
+    summarize.add_argument("--answer-chars", type=int, default=400, help="Length of every generated summary and answer")
+    summarize.add_argument("--hedge-after", type=float, default=0, help="Hedge requests after this many seconds, as in summarizer.py")
+    summarize.add_argument("--max-attempts", type=int, default=4, help="Attempts per LLM call, as in summarizer.py")
+
+    report = parser.add_argument_group("report")
+    report.add_argument("--json", dest="json_path", default=None, help="Write the results to this JSON file, e.g. to use as a baseline later")
+    report.add_argument("--baseline", default=None, help="JSON results of an earlier run; exit with status 1 if a stage got slower, used more requests or more memory")
+    report.add_argument("--tolerance", type=float, default=0.2, help="Relative change against the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    repo = SyntheticRepo(args.files, args.file_size, args.depth, args.fanout, args.seed)
+    total_bytes = sum(len(data) for data in repo.files.values())
+    print(f"Synthetic repository: {len(repo.files)} files, {len(repo.folders)} folders, {total_bytes / 1024 / 1024:.1f} MB")
+
+    results = []
+    if "fetch" in args.stages:
+        github = FakeGitHub(repo, args.github_latency)
+        try:
+            for mode in args.modes:
+                options = {"api_url": github.api_url, "raw_url": github.raw_url, "mode": mode, "workers": args.fetch_workers}
+                results.append(run_stage(f"fetch:{mode}", "fetch", options, github, args.verbose))
+        finally:
+            github.close()
+
+    if "parse" in args.stages:
+        with tempfile.TemporaryDirectory() as directory:
+            repo.write_to(directory)
+            options = {"directory": directory, "workers": args.fetch_workers}
+            results.append(run_stage("parse:local", "parse", options, None, args.verbose))
+
+    if "summarize" in args.stages:
+        chat = FakeChat(args.llm_latency, args.llm_jitter, args.llm_error_rate, args.answer_chars, args.seed)
+        try:
+            options = {"chat_url": chat.api_url, "repo": repo, "rows": args.rows, "workers": args.summarize_workers,
+                       "answer_workers": args.answer_workers, "batch_answers": args.batch_answers,
+                       "hedge_after": args.hedge_after, "max_attempts": args.max_attempts}
+            results.append(run_stage("summarize", "summarize", options, chat, args.verbose))
+        finally:
+            chat.close()
+
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+    if args.baseline:
+        regressions = compare_baseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,597 @@
+import requests
+import csv
+import hashlib
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, urlparse
+from requests.adapters import HTTPAdapter
+from metrics import add_metrics_arguments, metrics
+
+GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN", "") #Add your github token
+MAX_WORKERS = 8
+MAX_RATE_LIMIT_RETRIES = 5
+# Overridable so the parsers can be pointed at GitHub Enterprise or a local stand-in such as benchmark.py's
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip('/')
+GITHUB_RAW_URL = os.environ.get("GITHUB_RAW_URL", "https://raw.githubusercontent.com").rstrip('/')
+GRAPHQL_BATCH_FILES = 100
+GRAPHQL_BATCH_BYTES = 1024 * 1024
+DEFAULT_HEADER = "The following document is located at"
+
+class ExtensionFilter:
+    """Keeps only files whose name ends with one of the given extensions"""
+
+    def __init__(self, extensions):
+        self.extensions = tuple(extensions)
+
+    def skip_dir(self, path):
+        return False
+
+    def skip_file(self, path, size=None):
+        return not path.endswith(self.extensions)
+
+class ExcludeFolderFilter:
+    """Drops every folder with one of the given names, at any depth"""
+
+    def __init__(self, folder_names):
+        self.folder_names = set(folder_names)
+
+    def skip_dir(self, path):
+        return path.rsplit('/', 1)[-1] in self.folder_names
+
+    def skip_file(self, path, size=None):
+        return any(part in self.folder_names for part in path.split('/')[:-1])
+
+class RegexFilter:
+    """Drops folders and files whose path matches a regex; a matching folder drops everything below it"""
+
+    def __init__(self, pattern):
+        self.pattern = re.compile(pattern)
+
+    def skip_dir(self, path):
+        return self.pattern.search(path) is not None
+
+    def skip_file(self, path, size=None):
+        parts = path.split('/')
+        return any(self.pattern.search('/'.join(parts[:i])) for i in range(1, len(parts) + 1))
+
+class MaxSizeFilter:
+    """Drops files larger than max_size bytes"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+
+    def skip_dir(self, path):
+        return False
+
+    def skip_file(self, path, size=None):
+        return size is not None and size > self.max_size
+
+class FilterChain:
+    """Runs a list of filters against the listing, before anything is downloaded"""
+
+    def __init__(self, filters=()):
+        self.filters = list(filters)
+
+    def skip_dir(self, path):
+        return any(f.skip_dir(path) for f in self.filters)
+
+    def skip_file(self, path, size=None):
+        return any(f.skip_file(path, size) for f in self.filters)
+
+class RateLimiter:
+    """Token bucket shared by all workers that also pauses them until GitHub's rate limit resets"""
+
+    def __init__(self, rate=None, burst=MAX_WORKERS):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.remaining = None
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                wait = self.paused_until - time.time()
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+                    now = time.monotonic()
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update(self, response):
+        headers = response.headers
+        with self.lock:
+            if 'X-RateLimit-Remaining' in headers:
+                self.remaining = int(headers['X-RateLimit-Remaining'])
+                if self.remaining == 0 and 'X-RateLimit-Reset' in headers:
+                    # The reset header is a UTC epoch second; wait one more to absorb clock skew
+                    self.pause_until(int(headers['X-RateLimit-Reset']) + 1)
+            if 'Retry-After' in headers and response.status_code in (403, 429):
+                self.pause_until(time.time() + retry_after_seconds(headers['Retry-After']))
+
+    def pause_until(self, timestamp):
+        if timestamp > self.paused_until:
+            metrics.inc("github_rate_limit_pause_seconds_total", max(timestamp - max(self.paused_until, time.time()), 0))
+            self.paused_until = timestamp
+            print(f"GitHub rate limit reached, pausing for {max(timestamp - time.time(), 0):.0f}s...")
+
+def retry_after_seconds(value):
+    try:
+        return float(value)
+    except ValueError:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+
+def is_rate_limited(response):
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and (
+        response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers
+    )
+
+class RateLimitedSession(requests.Session):
+    """Session that routes GitHub API calls through a RateLimiter and retries them after a rate limit pause"""
+
+    def __init__(self, limiter):
+        super().__init__()
+        self.limiter = limiter
+
+    def request(self, method, url, *args, **kwargs):
+        # Raw file downloads do not count against the API quota, so only API calls take a token
+        host = urlparse(url).hostname
+        metered = host == urlparse(GITHUB_API_URL).hostname
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            if metered or attempt:
+                self.limiter.acquire()
+            with metrics.timer("github_request_seconds", host=host):
+                response = super().request(method, url, *args, **kwargs)
+            metrics.inc("github_requests_total", host=host, status=response.status_code)
+            self.limiter.update(response)
+            if not is_rate_limited(response) or attempt == MAX_RATE_LIMIT_RETRIES:
+                return response
+            response.close()
+            metrics.inc("github_retries_total", reason="rate_limit")
+            print(f"Rate limited on {url}, retrying after the pause...")
+        return response
+
+def parse_github_url(repo_url):
+    parts = repo_url.rstrip('/').split('/')
+
+    if len(parts) < 5 or parts[2] != "github.com":
+        print("Error: Invalid GitHub URL. Please check the format.")
+        raise ValueError("Invalid GitHub URL. Ensure the URL is in the format: https://github.com/user/repo/tree/branch/path")
+
+    user = parts[3]
+    repo = parts[4]
+    branch = None
+    subpath = ''
+
+    if "tree" in parts:
+        branch = parts[6]
+        subpath = '/'.join(parts[7:]) if len(parts) > 7 else ''
+
+    return user, repo, branch, subpath
+
+def create_session(max_workers=MAX_WORKERS, rate=None):
+    # One pooled session shared by all workers so each file reuses an open connection and one rate limiter
+    session = RateLimitedSession(RateLimiter(rate, burst=max_workers))
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if GITHUB_TOKEN:
+        session.headers.update({
+            "Authorization": f"Bearer {GITHUB_TOKEN}"
+        })
+    return session
+
+def write_cache_file(cache_file, data):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_file, cache_file)
+
+def blob_cache_path(cache_dir, sha):
+    return os.path.join(cache_dir, "blobs", sha[:2], sha)
+
+def get_json(session, url, cache_dir=None, immutable=False):
+    if cache_dir is None:
+        response = session.get(url)
+        response.raise_for_status()
+        return response.json()
+
+    cache_file = os.path.join(cache_dir, "listings", hashlib.sha1(url.encode('utf-8')).hexdigest() + ".json")
+    cached = None
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        # Listings addressed by a SHA never change, so they are served without a request
+        if immutable:
+            metrics.inc("github_listings_total", result="cached")
+            return cached['body']
+
+    headers = {}
+    if cached and cached.get('etag'):
+        headers["If-None-Match"] = cached['etag']
+    response = session.get(url, headers=headers)
+    if response.status_code == 304:
+        print(f"Listing not modified, using cache: {url}")
+        metrics.inc("github_listings_total", result="not_modified")
+        return cached['body']
+    response.raise_for_status()
+    metrics.inc("github_listings_total", result="fetched")
+    metrics.inc("github_bytes_fetched_total", len(response.content), kind="listing")
+    body = response.json()
+    write_cache_file(cache_file, json.dumps({"etag": response.headers.get('ETag'), "body": body}).encode('utf-8'))
+    return body
+
+def get_github_contents(repo_url, chain=None, session=None, cache_dir=None):
+    print("Starting to fetch GitHub repository contents...")
+    chain = chain or FilterChain()
+    session = session or create_session()
+    user, repo, branch, subpath = parse_github_url(repo_url)
+
+    if branch is not None:
+        api_url = f"{GITHUB_API_URL}/repos/{user}/{repo}/contents/{subpath}?ref={branch}"
+    else:
+        api_url = f"{GITHUB_API_URL}/repos/{user}/{repo}/contents/"
+
+    print(f"Fetching contents from: {api_url}")
+    with metrics.timer("github_listing_seconds", mode="contents"):
+        entries = process_contents(get_json(session, api_url, cache_dir), chain, session, cache_dir)
+    print(f"Repository contents fetched successfully. Total entries: {len(entries)}.")
+    return entries
+
+def process_contents(contents, chain, session, cache_dir=None, entries=None, parent_path=""):
+    if entries is None:
+        entries = []
+    for item in contents:
+        path = parent_path + item['name']
+
+        if item['type'] == 'dir':
+            if chain.skip_dir(path):
+                print(f"Skipping folder: {path}")
+                continue
+            print(f"Entering directory: {path}")
+            entries.append({"path": path, "type": "tree", "sha": item.get('sha')})
+            dir_contents = get_json(session, item['url'], cache_dir)
+            process_contents(dir_contents, chain, session, cache_dir, entries, path + "/")
+        elif item['type'] == 'file':
+            entries.append({
+                "path": path,
+                "type": "blob",
+                "sha": item.get('sha'),
+                "size": item.get('size'),
+                "download_url": item['download_url'],
+            })
+    return entries
+
+def get_github_tree(repo_url, chain=None, session=None, cache_dir=None):
+    print("Starting to fetch GitHub repository tree...")
+    chain = chain or FilterChain()
+    session = session or create_session()
+    user, repo, branch, subpath = parse_github_url(repo_url)
+    api_base = f"{GITHUB_API_URL}/repos/{user}/{repo}"
+
+    if branch is None:
+        branch = get_json(session, api_base, cache_dir)['default_branch']
+
+    print(f"Resolving branch '{branch}' to a tree SHA...")
+    commit = get_json(session, f"{api_base}/commits/{branch}", cache_dir)
+    tree_sha = commit['commit']['tree']['sha']
+
+    # Walk down to the requested subpath one level at a time instead of listing the whole repository
+    for name in filter(None, subpath.split('/')):
+        tree = get_json(session, f"{api_base}/git/trees/{tree_sha}", cache_dir, immutable=True)
+        subtrees = {item['path']: item['sha'] for item in tree['tree'] if item['type'] == 'tree'}
+        if name not in subtrees:
+            raise ValueError(f"Path '{subpath}' not found on branch '{branch}'")
+        tree_sha = subtrees[name]
+
+    raw_base = f"{GITHUB_RAW_URL}/{user}/{repo}/{commit['sha']}/"
+    # Paths are percent-encoded so names with '#', '?' or spaces are not cut off as a fragment or query
+    if subpath.strip('/'):
+        raw_base += quote(subpath.strip('/')) + "/"
+
+    with metrics.timer("github_listing_seconds", mode="tree"):
+        entries = list_tree(api_base, tree_sha, chain, session, cache_dir=cache_dir)
+    for entry in entries:
+        if entry['type'] == 'blob':
+            entry['download_url'] = raw_base + quote(entry['path'])
+    print(f"Repository tree fetched successfully. Total entries: {len(entries)}.")
+    return entries
+
+def list_tree(api_base, tree_sha, chain, session, prefix="", cache_dir=None):
+    tree = get_json(session, f"{api_base}/git/trees/{tree_sha}?recursive=1", cache_dir, immutable=True)
+    if not tree.get('truncated'):
+        return [dict(item, path=prefix + item['path']) for item in tree['tree']]
+
+    # GitHub caps recursive listings, so page through the truncated tree one subtree at a time
+    print(f"Tree listing truncated at '{prefix or '/'}', listing subtrees separately...")
+    tree = get_json(session, f"{api_base}/git/trees/{tree_sha}", cache_dir, immutable=True)
+    entries = []
+    for item in tree['tree']:
+        entry = dict(item, path=prefix + item['path'])
+        entries.append(entry)
+        if item['type'] == 'tree' and not chain.skip_dir(entry['path']):
+            entries.extend(list_tree(api_base, item['sha'], chain, session, entry['path'] + "/", cache_dir))
+    return entries
+
+def select_files(entries, chain):
+    files = []
+    for entry in entries:
+        if entry['type'] != 'blob':
+            continue
+        if chain.skip_file(entry['path'], entry.get('size')):
+            continue
+        files.append((entry['path'], entry['download_url'], entry.get('sha')))
+    print(f"Selected {len(files)} files from the listing.")
+    return files
+
+def graphql_batches(shas, sizes):
+    batch, batch_bytes = [], 0
+    for sha in shas:
+        size = sizes.get(sha) or 0
+        if batch and (len(batch) >= GRAPHQL_BATCH_FILES or batch_bytes + size > GRAPHQL_BATCH_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(sha)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+def fetch_graphql_blobs(files, session, owner, repo, sizes):
+    """Fetches blob texts by SHA in size-bounded GraphQL queries; anything it cannot return is left for raw downloads"""
+    shas = list(dict.fromkeys(sha for _, _, sha in files if sha and (sizes.get(sha) or 0) <= GRAPHQL_BATCH_BYTES))
+    blobs = {}
+    requests_made = 0
+    for batch in graphql_batches(shas, sizes):
+        fields = " ".join(
+            f'b{i}: object(oid: "{sha}") {{ ... on Blob {{ text isBinary isTruncated }} }}' for i, sha in enumerate(batch)
+        )
+        query = f"query($owner: String!, $name: String!) {{ repository(owner: $owner, name: $name) {{ {fields} }} }}"
+        requests_made += 1
+        try:
+            with metrics.timer("github_graphql_batch_seconds"):
+                response = session.post(f"{GITHUB_API_URL}/graphql", json={"query": query, "variables": {"owner": owner, "name": repo}})
+            response.raise_for_status()
+            metrics.inc("github_bytes_fetched_total", len(response.content), kind="graphql")
+            body = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"GraphQL batch of {len(batch)} files failed, falling back to raw downloads: {e}")
+            continue
+        repository = (body.get('data') or {}).get('repository') or {}
+        for i, sha in enumerate(batch):
+            blob = repository.get(f"b{i}")
+            # Binary and oversized blobs come back without usable text and are downloaded raw instead
+            if blob and blob.get('text') is not None and not blob.get('isBinary') and not blob.get('isTruncated'):
+                blobs[sha] = blob['text'].encode('utf-8')
+
+    print(f"Fetched {len(blobs)} of {len(shas)} blobs in {requests_made} GraphQL requests.")
+    return blobs
+
+def load_checkpoint(checkpoint_file):
+    fetched = {}
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut short if the previous run was killed mid-write
+                    continue
+                fetched[(record['path'], record['sha'])] = record['text']
+        print(f"Resuming from checkpoint with {len(fetched)} files already fetched: {checkpoint_file}")
+    return fetched
+
+def format_document(header, path, file_content):
+    return f"{header} {path}\n------\n{file_content}\n------"
+
+def iter_download_files(files, session, header=DEFAULT_HEADER, max_workers=MAX_WORKERS, cache_dir=None,
+                        checkpoint_file=None, batch_fetch=None):
+    # Documents are yielded in listing order with a bounded window of downloads in flight, so a slow consumer holds back fetching
+    fetched = load_checkpoint(checkpoint_file)
+    checkpoint_lock = threading.Lock()
+    checkpoint = open(checkpoint_file, 'a', encoding='utf-8') if checkpoint_file else None
+
+    prefetched = {}
+    if batch_fetch:
+        pending = [
+            file for file in files
+            if (file[0], file[2]) not in fetched and not (cache_dir and file[2] and os.path.exists(blob_cache_path(cache_dir, file[2])))
+        ]
+        if pending:
+            prefetched = batch_fetch(pending)
+
+    def fetch(file):
+        path, download_url, sha = file
+        if (path, sha) in fetched:
+            metrics.inc("github_files_total", source="checkpoint")
+            return format_document(header, path, fetched[(path, sha)])
+        cache_file = blob_cache_path(cache_dir, sha) if cache_dir and sha else None
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                data = f.read()
+            metrics.inc("github_files_total", source="cache")
+        elif sha in prefetched:
+            data = prefetched[sha]
+            metrics.inc("github_files_total", source="graphql")
+            if cache_file:
+                write_cache_file(cache_file, data)
+        else:
+            try:
+                with metrics.timer("github_file_seconds"):
+                    file_response = session.get(download_url)
+                    file_response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to download {path}: {e}")
+                metrics.inc("github_files_total", source="failed")
+                return None
+            data = file_response.content
+            metrics.inc("github_files_total", source="raw")
+            metrics.inc("github_bytes_fetched_total", len(data), kind="file")
+            if cache_file:
+                write_cache_file(cache_file, data)
+            print(f"File content downloaded: {path}")
+        file_content = data.decode('utf-8', errors='replace')
+        if checkpoint:
+            with checkpoint_lock:
+                checkpoint.write(json.dumps({"path": path, "sha": sha, "text": file_content}) + "\n")
+                checkpoint.flush()
+        return format_document(header, path, file_content)
+
+    if cache_dir:
+        cached = sum(1 for _, _, sha in files if sha and os.path.exists(blob_cache_path(cache_dir, sha)))
+        print(f"{cached} of {len(files)} files are unchanged and served from the cache.")
+    print(f"Downloading {len(files)} files with {max_workers} workers...")
+    failed = 0
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for file in files:
+                pending.append(executor.submit(fetch, file))
+                if len(pending) < max_workers * 4:
+                    continue
+                result = pending.popleft().result()
+                if result is None:
+                    failed += 1
+                else:
+                    yield result
+            while pending:
+                result = pending.popleft().result()
+                if result is None:
+                    failed += 1
+                else:
+                    yield result
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    if failed:
+        print(f"Failed to download {failed} files.")
+
+def iter_archive(repo_url, chain=None, header=DEFAULT_HEADER, session=None):
+    print("Processing repository archive...")
+    chain = chain or FilterChain()
+    session = session or create_session()
+    user, repo, branch, subpath = parse_github_url(repo_url)
+    archive_url = f"{GITHUB_API_URL}/repos/{user}/{repo}/tarball"
+    if branch is not None:
+        archive_url += f"/{branch}"
+    prefix = subpath.strip('/') + "/" if subpath.strip('/') else ""
+
+    print(f"Streaming repository archive from: {archive_url}")
+    response = session.get(archive_url, stream=True)
+    response.raise_for_status()
+    response.raw.decode_content = True
+
+    # Read the gzipped tar as a stream so only one member is held in memory at a time
+    with tarfile.open(fileobj=response.raw, mode='r|gz') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+
+            # Every member sits under a "<user>-<repo>-<sha>/" top-level folder
+            path = member.name.split('/', 1)[-1]
+            if not path.startswith(prefix):
+                continue
+            path = path[len(prefix):]
+            if chain.skip_file(path, member.size):
+                continue
+
+            print(f"Processing: {path}")
+            data = archive.extractfile(member).read()
+            metrics.inc("github_files_total", source="archive")
+            metrics.inc("github_bytes_fetched_total", len(data), kind="archive")
+            file_content = data.decode('utf-8', errors='replace')
+            yield format_document(header, path, file_content)
+
+def iter_ingest(repo_url, filters=(), header=DEFAULT_HEADER, mode="tree", max_workers=MAX_WORKERS, cache_dir=None,
+                session=None, checkpoint_file=None, rate=None, fetch="raw"):
+    chain = FilterChain(filters)
+    session = session or create_session(max_workers, rate)
+
+    if mode == "archive":
+        yield from iter_archive(repo_url, chain, header, session)
+        return
+    if mode == "tree":
+        entries = get_github_tree(repo_url, chain, session, cache_dir)
+    else:
+        entries = get_github_contents(repo_url, chain, session, cache_dir)
+
+    batch_fetch = None
+    if fetch == "graphql":
+        if GITHUB_TOKEN:
+            user, repo = parse_github_url(repo_url)[:2]
+            sizes = {entry['sha']: entry.get('size') for entry in entries if entry['type'] == 'blob'}
+            batch_fetch = lambda files: fetch_graphql_blobs(files, session, user, repo, sizes)
+        else:
+            print("The GraphQL API needs a GitHub token, falling back to raw downloads.")
+
+    yield from iter_download_files(select_files(entries, chain), session, header, max_workers, cache_dir,
+                                   checkpoint_file, batch_fetch)
+
+def ingest(repo_url, filters=(), header=DEFAULT_HEADER, mode="tree", max_workers=MAX_WORKERS, cache_dir=None,
+           session=None, checkpoint_file=None, rate=None, fetch="raw"):
+    paths = list(iter_ingest(repo_url, filters, header, mode, max_workers, cache_dir, session, checkpoint_file, rate,
+                             fetch))
+    print(f"Finished processing. Total files processed: {len(paths)}.")
+    return paths
+
+def write_to_csv(data, output_file):
+    print(f"Writing data to CSV file: {output_file}")
+    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        for row in data:
+            writer.writerow([row])
+    print(f"CSV file '{output_file}' written successfully.")
+
+def add_common_arguments(parser):
+    parser.add_argument("repo_url", help="URL of the GitHub repository (e.g., https://github.com/user/repo/tree/branch)")
+    parser.add_argument("output_path", help="Path to the output CSV file")
+    parser.add_argument("--mode", choices=["tree", "contents", "archive"], default="tree", help="List files with a single Git Trees API call (tree), one contents call per directory (contents), or stream the whole repository as one tarball (archive)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Number of files to download concurrently")
+    parser.add_argument("--cache-dir", default=None, help="Directory for the blob SHA content cache and listing ETags, reused across runs")
+    parser.add_argument("--max-size", type=int, default=None, help="Skip files larger than this many bytes")
+    parser.add_argument("--fetch", choices=["raw", "graphql"], default="raw", help="Download each file separately (raw) or batch many blobs into each GraphQL query (graphql), which suits selective ingests of scattered files")
+    add_metrics_arguments(parser)
+    parser.add_argument("--rate", type=float, default=None, help="Cap GitHub API calls at this many requests per second across all workers (default: paced only by GitHub's rate limit headers)")
+
+def run(args, filters=(), header=DEFAULT_HEADER):
+    filters = list(filters)
+    if args.max_size is not None:
+        filters.append(MaxSizeFilter(args.max_size))
+
+    try:
+        print(f"Starting script for repository: {args.repo_url}")
+        # Fetched files are appended here as they arrive so an interrupted run picks up where it stopped
+        checkpoint_file = args.output_path + ".partial"
+        paths = ingest(args.repo_url, filters, header, args.mode, args.workers, args.cache_dir,
+                       checkpoint_file=checkpoint_file, rate=args.rate, fetch=args.fetch)
+        with metrics.timer("output_write_seconds", format="csv"):
+            write_to_csv(paths, args.output_path)
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        print("Script executed successfully.")
+    except requests.exceptions.HTTPError as e:
+        print(f"HTTP Error occurred: {e}")
+    except FileNotFoundError as e:
+        print(f"File Error occurred: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+    finally:
+        metrics.write(args.metrics_json, args.metrics_prom)
@@ -1,70 +1,283 @@
 import os
 import csv
-import sys
+import argparse
+import fnmatch
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 csv.field_size_limit(10**9)
 
-def process_local_repo(repo_path, paths=[]):
+MAX_FILE_SIZE = 1024 * 1024
+SNIFF_BYTES = 8192
+DISCARD_CHUNK = 1024 * 1024
+MAX_WORKERS = 8
+# Folders that are almost never worth ingesting and usually hold most of the bytes on disk
+DEFAULT_IGNORES = [
+    ".git/", ".hg/", ".svn/", "node_modules/", "target/", "venv/", ".venv/", "__pycache__/",
+    ".tox/", ".nox/", ".mypy_cache/", ".pytest_cache/", ".ruff_cache/", "build/", "dist/",
+    ".next/", ".gradle/", ".idea/", ".vscode/", "*.egg-info/",
+]
+
+def parse_ignore_patterns(lines, base=""):
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        # A slash at the start or in the middle anchors the pattern to the folder of its .gitignore
+        anchored = '/' in line
+        line = line.lstrip('/')
+        if line:
+            rules.append((base, line, negated, dir_only, anchored))
+    return rules
+
+def load_gitignore(repo_path, relative_dir):
+    gitignore = os.path.join(repo_path, relative_dir, ".gitignore")
+    if not os.path.isfile(gitignore):
+        return []
+    with open(gitignore, 'r', encoding='utf-8', errors='ignore') as f:
+        return parse_ignore_patterns(f, relative_dir)
+
+def is_ignored(relative_path, is_dir, rules):
+    ignored = False
+    name = os.path.basename(relative_path)
+    for base, pattern, negated, dir_only, anchored in rules:
+        if dir_only and not is_dir:
+            continue
+        if anchored:
+            if base and not relative_path.startswith(base + "/"):
+                continue
+            target = relative_path[len(base) + 1:] if base else relative_path
+        else:
+            target = name
+        if fnmatch.fnmatchcase(target, pattern):
+            ignored = not negated
+    return ignored
+
+def walk_repo(repo_path, exclude_patterns=(), use_gitignore=True, use_default_ignores=True):
+    root_rules = []
+    if use_default_ignores:
+        root_rules += parse_ignore_patterns(DEFAULT_IGNORES)
+    root_rules += parse_ignore_patterns(exclude_patterns)
+    rules_by_dir = {"": root_rules}
+
     for root, dirs, files in os.walk(repo_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                file_content = f.read()
-            relative_path = os.path.relpath(file_path, repo_path)
-            extension = os.path.splitext(relative_path)[1]
-            
-            if extension == '.md':
-                formatted_content = f"The following is a markdown document located at {relative_path}\n------\n{file_content}\n------"
-            elif extension == '.rs':
-                formatted_content = f"```rust:{relative_path}\n{file_content}\n```"
-            elif extension == '.sh':
-                formatted_content = f"```bash:{relative_path}\n{file_content}\n```"
-            elif extension == '.py':
-                formatted_content = f"```python:{relative_path}\n{file_content}\n```"
-            elif extension == '.js':
-                formatted_content = f"```javascript:{relative_path}\n{file_content}\n```"
-            elif extension == '.json':
-                formatted_content = f"```json:{relative_path}\n{file_content}\n```"
-            elif extension == '.txt':
-                formatted_content = f"The following is a plain text file located at {relative_path}\n------\n{file_content}\n------"
-            elif extension == '.toml':
-                formatted_content = f"```toml:{relative_path}\n{file_content}\n```"
-            elif extension == '.jsx':
-                formatted_content = f"```jsx:{relative_path}\n{file_content}\n```"
-            elif extension == '.css':
-                formatted_content = f"```css:{relative_path}\n{file_content}\n```"
-            elif extension == '.java':
-                formatted_content = f"```java:{relative_path}\n{file_content}\n```"
-            elif extension == '.hpp':
-                formatted_content = f"```hpp:{relative_path}\n{file_content}\n```"
-            elif extension == '.c':
-                formatted_content = f"```c:{relative_path}\n{file_content}\n```"
-            elif extension == '.yml':
-                formatted_content = f"```yml:{relative_path}\n{file_content}\n```"
-            elif extension == '.xml':
-                formatted_content = f"```xml:{relative_path}\n{file_content}\n```"
-            elif extension == '.html':
-                formatted_content = f"```html:{relative_path}\n{file_content}\n```"
-            elif extension == '.tsx':
-                formatted_content = f"```typescript:{relative_path}\n{file_content}"
-            else:
-                formatted_content = f"The following document is located at {relative_path}\n------\n{file_content}\n------"
-            paths.append({"FormattedContent": formatted_content})
-    return paths
+        relative_dir = os.path.relpath(root, repo_path).replace(os.sep, "/")
+        if relative_dir == ".":
+            relative_dir = ""
+        rules = rules_by_dir.pop(relative_dir)
+        if use_gitignore:
+            rules = rules + load_gitignore(repo_path, relative_dir)
+
+        # Pruning dirs in place stops os.walk from ever descending into ignored folders
+        kept = []
+        for name in sorted(dirs):
+            relative_path = f"{relative_dir}/{name}" if relative_dir else name
+            if is_ignored(relative_path, True, rules):
+                print(f"Skipping folder: {relative_path}")
+                continue
+            kept.append(name)
+            rules_by_dir[relative_path] = rules
+        dirs[:] = kept
+
+        for name in sorted(files):
+            relative_path = f"{relative_dir}/{name}" if relative_dir else name
+            if not is_ignored(relative_path, False, rules):
+                yield os.path.join(root, name), relative_path
+
+def is_binary(sample):
+    # Text files practically never contain NUL bytes, the same heuristic git uses
+    return b'\0' in sample
+
+def read_text_file(file_path, max_file_size=MAX_FILE_SIZE):
+    if os.path.getsize(file_path) > max_file_size:
+        print(f"Skipping large file: {file_path}")
+        return None
+    with open(file_path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+        if is_binary(sample):
+            print(f"Skipping binary file: {file_path}")
+            return None
+        data = sample + f.read()
+    return data.decode('utf-8', errors='ignore')
+
+def format_content(relative_path, file_content):
+    extension = os.path.splitext(relative_path)[1]
+
+    if extension == '.md':
+        formatted_content = f"The following is a markdown document located at {relative_path}\n------\n{file_content}\n------"
+    elif extension == '.rs':
+        formatted_content = f"```rust:{relative_path}\n{file_content}\n```"
+    elif extension == '.sh':
+        formatted_content = f"```bash:{relative_path}\n{file_content}\n```"
+    elif extension == '.py':
+        formatted_content = f"```python:{relative_path}\n{file_content}\n```"
+    elif extension == '.js':
+        formatted_content = f"```javascript:{relative_path}\n{file_content}\n```"
+    elif extension == '.json':
+        formatted_content = f"```json:{relative_path}\n{file_content}\n```"
+    elif extension == '.txt':
+        formatted_content = f"The following is a plain text file located at {relative_path}\n------\n{file_content}\n------"
+    elif extension == '.toml':
+        formatted_content = f"```toml:{relative_path}\n{file_content}\n```"
+    elif extension == '.jsx':
+        formatted_content = f"```jsx:{relative_path}\n{file_content}\n```"
+    elif extension == '.css':
+        formatted_content = f"```css:{relative_path}\n{file_content}\n```"
+    elif extension == '.java':
+        formatted_content = f"```java:{relative_path}\n{file_content}\n```"
+    elif extension == '.hpp':
+        formatted_content = f"```hpp:{relative_path}\n{file_content}\n```"
+    elif extension == '.c':
+        formatted_content = f"```c:{relative_path}\n{file_content}\n```"
+    elif extension == '.yml':
+        formatted_content = f"```yml:{relative_path}\n{file_content}\n```"
+    elif extension == '.xml':
+        formatted_content = f"```xml:{relative_path}\n{file_content}\n```"
+    elif extension == '.html':
+        formatted_content = f"```html:{relative_path}\n{file_content}\n```"
+    elif extension == '.tsx':
+        formatted_content = f"```typescript:{relative_path}\n{file_content}"
+    else:
+        formatted_content = f"The following document is located at {relative_path}\n------\n{file_content}\n------"
+    return formatted_content
+
+def is_path_ignored(relative_path, rules):
+    parts = relative_path.split('/')
+    for i in range(1, len(parts)):
+        if is_ignored('/'.join(parts[:i]), True, rules):
+            return True
+    return is_ignored(relative_path, False, rules)
+
+def git_changed_files(repo_path, base, head):
+    # Renames are reported as a delete plus an add so the old path gets a tombstone
+    output = subprocess.run(
+        ["git", "-C", repo_path, "diff", "--name-status", "--no-renames", "-z", base, head],
+        check=True, capture_output=True,
+    ).stdout.decode('utf-8', errors='surrogateescape')
+    fields = output.split('\0')
+    changed = []
+    deleted = []
+    for status, path in zip(fields[0::2], fields[1::2]):
+        if status == 'D':
+            deleted.append(path)
+        elif status in ('A', 'M', 'T'):
+            changed.append(path)
+    return changed, deleted
+
+def read_git_blobs(repo_path, revision, paths, max_file_size=MAX_FILE_SIZE):
+    # Blobs come straight from the object database of the given revision, so no checkout is needed
+    with subprocess.Popen(["git", "-C", repo_path, "cat-file", "--batch"],
+                          stdin=subprocess.PIPE, stdout=subprocess.PIPE) as process:
+        for path in paths:
+            if '\n' in path:
+                print(f"Skipping file with a newline in its name: {path!r}")
+                continue
+            process.stdin.write(f"{revision}:{path}\n".encode('utf-8', errors='surrogateescape'))
+            process.stdin.flush()
+            header = process.stdout.readline().decode('utf-8', errors='replace').split()
+            if len(header) != 3:
+                print(f"Skipping missing object: {path}")
+                continue
+            _, object_type, size = header
+            size = int(size)
+            if object_type != 'blob' or size > max_file_size:
+                if object_type == 'blob':
+                    print(f"Skipping large file: {path}")
+                # The object is still on the pipe, so drain it in chunks to reach the next header
+                remaining = size + 1
+                while remaining > 0:
+                    chunk = process.stdout.read(min(remaining, DISCARD_CHUNK))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                continue
+            data = process.stdout.read(size)
+            process.stdout.read(1)
+            if is_binary(data[:SNIFF_BYTES]):
+                print(f"Skipping binary file: {path}")
+                continue
+            yield path, data.decode('utf-8', errors='ignore')
+        process.stdin.close()
+
+def process_git_delta(repo_path, base, head, tombstones_path, max_file_size=MAX_FILE_SIZE, exclude_patterns=(),
+                      use_default_ignores=True):
+    rules = parse_ignore_patterns(DEFAULT_IGNORES) if use_default_ignores else []
+    rules += parse_ignore_patterns(exclude_patterns)
+    changed, deleted = git_changed_files(repo_path, base, head)
+    changed = [path for path in changed if not is_path_ignored(path, rules)]
+    print(f"{len(changed)} files added or modified and {len(deleted)} files deleted between {base} and {head}.")
+
+    with open(tombstones_path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{path}\n" for path in deleted)
+    print(f"Deleted paths written to '{tombstones_path}'.")
+
+    for path, file_content in read_git_blobs(repo_path, head, changed, max_file_size):
+        yield {"FormattedContent": format_content(path, file_content)}
+
+def read_and_format(file_path, relative_path, max_file_size=MAX_FILE_SIZE):
+    try:
+        file_content = read_text_file(file_path, max_file_size)
+    except OSError as e:
+        print(f"Skipping unreadable file {file_path}: {e}")
+        return None
+    if file_content is None:
+        return None
+    return format_content(relative_path, file_content)
+
+def process_local_repo(repo_path, max_file_size=MAX_FILE_SIZE, exclude_patterns=(), use_gitignore=True,
+                       use_default_ignores=True, max_workers=MAX_WORKERS):
+    # Yield rows one file at a time so memory use does not grow with the size of the repository.
+    # Reads run on a thread pool with a bounded window of pending files, and rows keep walk order.
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for file_path, relative_path in walk_repo(repo_path, exclude_patterns, use_gitignore, use_default_ignores):
+            pending.append(executor.submit(read_and_format, file_path, relative_path, max_file_size))
+            if len(pending) >= max_workers * 4:
+                formatted_content = pending.popleft().result()
+                if formatted_content is not None:
+                    yield {"FormattedContent": formatted_content}
+        while pending:
+            formatted_content = pending.popleft().result()
+            if formatted_content is not None:
+                yield {"FormattedContent": formatted_content}
 
 def write_to_csv(data, output_file):
+    count = 0
     with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile)
         for row in data:
             writer.writerow([row['FormattedContent']])
+            count += 1
+    return count
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python script.py <repo_url> <output_csv_path>")
-        sys.exit(1)
-
-    repo_path = sys.argv[1]
-    output_path = sys.argv[2]
-    paths = process_local_repo(repo_path)
-    write_to_csv(paths, output_path)
-    print(f"CSV file '{output_path}' generated successfully.")
+    parser = argparse.ArgumentParser(description="Convert the files of a local repository into a CSV file.")
+    parser.add_argument("repo_path", help="Path to the local repository")
+    parser.add_argument("output_path", help="Path to the output CSV file")
+    parser.add_argument("--max-file-size", type=int, default=MAX_FILE_SIZE, help="Skip files larger than this many bytes")
+    parser.add_argument("--exclude", nargs='*', default=[], help="Extra .gitignore-style patterns to skip, e.g. docs/archive/ '*.lock'")
+    parser.add_argument("--no-gitignore", action="store_true", help="Do not honour .gitignore files")
+    parser.add_argument("--no-default-ignores", action="store_true", help="Also walk folders such as .git, node_modules, target and virtualenvs")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Number of files read concurrently")
+    parser.add_argument("--base", default=None, help="Only ingest files added or modified since this git revision")
+    parser.add_argument("--head", default="HEAD", help="Git revision to read files from when --base is given")
+    parser.add_argument("--tombstones", default=None, help="File listing paths deleted between --base and --head (default: <output_path>.deleted)")
+
+    args = parser.parse_args()
+
+    if args.base:
+        tombstones_path = args.tombstones or args.output_path + ".deleted"
+        rows = process_git_delta(args.repo_path, args.base, args.head, tombstones_path, args.max_file_size,
+                                 args.exclude, not args.no_default_ignores)
+    else:
+        rows = process_local_repo(args.repo_path, args.max_file_size, args.exclude, not args.no_gitignore,
+                                  not args.no_default_ignores, args.workers)
+    count = write_to_csv(rows, args.output_path)
+    print(f"CSV file '{args.output_path}' generated successfully with {count} files.")
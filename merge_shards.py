@@ -0,0 +1,81 @@
+import argparse
+import csv
+import os
+import sys
+from output_format import content_digest, open_output, read_documents, read_input_digests
+from summarizer import checkpoint_path, shard_of, shard_path
+
+csv.field_size_limit(10**9)
+
+def read_shard(path, output_format):
+    documents = {}
+    for content, summary, qna_list in read_documents(path, output_format):
+        documents.setdefault(content_digest(content), (content, summary, qna_list))
+    return documents
+
+def merge_shards(input_path, output_path, shard_count, output_format="csv", allow_incomplete=False):
+    # Input order, without repeats, is the order of the merged output
+    order = read_input_digests(input_path)
+    wanted = set(order)
+    expected = [0] * shard_count
+    for digest in order:
+        expected[shard_of(digest, shard_count)] += 1
+
+    documents = {}
+    incomplete = []
+    for index in range(shard_count):
+        path = shard_path(output_path, index, shard_count)
+        if not os.path.exists(path):
+            print(f"Shard {index}: missing ({path})")
+            incomplete.append(index)
+            continue
+        shard = read_shard(path, output_format)
+        done = sum(1 for digest in shard if digest in wanted and shard_of(digest, shard_count) == index)
+        print(f"Shard {index}: {done} of {expected[index]} rows")
+        if done < expected[index]:
+            incomplete.append(index)
+        for digest, document in shard.items():
+            if digest in wanted:
+                documents.setdefault(digest, document)
+
+    if incomplete and not allow_incomplete:
+        print(f"Incomplete shards: {', '.join(map(str, incomplete))}. Rerun each with --shard INDEX/{shard_count}, "
+              f"or pass --allow-incomplete to merge what is there.")
+        return None
+
+    # Documents whose rows left the input are dropped, so qdrant_index.py removes their points on the next sync
+    tmp_path = shard_path(output_path, "merging", shard_count)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    output = open_output(tmp_path, output_format)
+    merged = []
+    try:
+        for digest in order:
+            if digest in documents:
+                output.write(digest, *documents[digest])
+                merged.append(digest)
+    finally:
+        output.close()
+    os.replace(tmp_path, output_path)
+
+    # A later unsharded summarizer.py run on the merged output resumes instead of starting over
+    with open(checkpoint_path(output_path), 'w', encoding='utf-8') as f:
+        f.writelines(f"{digest}\n" for digest in merged)
+    return len(merged)
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the per-shard outputs of summarizer.py --shard into one deduplicated output in input order.")
+    parser.add_argument("input_path", help="The CSV the shards were summarized from")
+    parser.add_argument("output_path", help="The output_path the shards were run with; the merged result is written here")
+    parser.add_argument("--shards", type=int, required=True, help="Number of shards the input was split into")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], default="csv", help="Format the shards were written in")
+    parser.add_argument("--allow-incomplete", action="store_true", help="Merge even if some shards are missing rows")
+    args = parser.parse_args()
+
+    count = merge_shards(args.input_path, args.output_path, args.shards, args.output_format, args.allow_incomplete)
+    if count is None:
+        sys.exit(1)
+    print(f"Merged {count} documents into {args.output_path}")
+
+if __name__ == "__main__":
+    main()
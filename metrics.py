@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+class Metrics:
+    """Process-wide counters and latency histograms, exported as a JSON run report or a Prometheus textfile"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "count": 0, "sum": 0.0, "max": 0.0}
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+                    break
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            histogram["max"] = max(histogram["max"], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def report(self):
+        counters = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            counters.setdefault(name, {})[format_labels(labels) or "total"] = value
+        histograms = {}
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            histograms.setdefault(name, {})[format_labels(labels) or "all"] = {
+                "count": histogram["count"],
+                "sum": round(histogram["sum"], 6),
+                "mean": round(histogram["sum"] / histogram["count"], 6) if histogram["count"] else 0,
+                "max": round(histogram["max"], 6),
+                "p50": estimate_quantile(histogram, 0.5),
+                "p95": estimate_quantile(histogram, 0.95),
+                "p99": estimate_quantile(histogram, 0.99),
+            }
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def prometheus_lines(self):
+        lines = []
+        previous = None
+        for (name, labels), value in sorted(self.counters.items()):
+            if name != previous:
+                lines.append(f"# TYPE {name} counter")
+                previous = name
+            lines.append(f"{name}{prometheus_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name != previous:
+                lines.append(f"# TYPE {name} histogram")
+                previous = name
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{prometheus_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{prometheus_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{prometheus_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{prometheus_labels(labels)} {histogram['count']}")
+        return lines
+
+    def write(self, json_path=None, prometheus_path=None):
+        with self.lock:
+            if json_path:
+                write_atomic(json_path, json.dumps(self.report(), indent=2) + "\n")
+                print(f"Metrics report written to {json_path}")
+            if prometheus_path:
+                # node_exporter reads textfiles at any time, so the file is swapped in whole
+                write_atomic(prometheus_path, "\n".join(self.prometheus_lines()) + "\n")
+                print(f"Prometheus metrics written to {prometheus_path}")
+
+def format_labels(labels):
+    return ",".join(f"{key}={value}" for key, value in labels)
+
+def prometheus_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+def estimate_quantile(histogram, quantile):
+    # Upper bound of the bucket holding the quantile, capped at the largest value actually seen
+    target = quantile * histogram["count"]
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+        cumulative += count
+        if count and cumulative >= target:
+            return min(bound, round(histogram["max"], 6))
+    return round(histogram["max"], 6)
+
+def write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics-json", default=None, help="Write a JSON run report with latency histograms, counts, bytes and tokens to this file")
+    parser.add_argument("--metrics-prom", default=None, help="Write the same metrics in Prometheus textfile format to this file")
+
+metrics = Metrics()
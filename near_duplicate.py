@@ -0,0 +1,101 @@
+import hashlib
+import random
+import re
+import threading
+
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+# "The following ... located at <path>" from the GitHub scripts, or "```python:<path>" from local_parser.py
+HEADER_PATTERN = re.compile(r'\A(?:The following [^\n]*? located at ([^\n]*)\n------\n|```[\w+#.-]*:([^\n]*)\n)')
+
+def extract_path(content):
+    match = HEADER_PATTERN.match(content)
+    if not match:
+        return None
+    return match.group(1) if match.group(1) is not None else match.group(2)
+
+def strip_header(content):
+    # The path header differs between copies of the same file, so only the body is compared
+    return HEADER_PATTERN.sub('', content, count=1)
+
+def choose_bands(num_perm, threshold):
+    # Pick the LSH banding whose candidate threshold (1/b)^(1/r) sits closest below the similarity threshold
+    best = (1, num_perm)
+    best_gap = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        candidate_threshold = (1 / bands) ** (1 / rows)
+        if candidate_threshold > threshold:
+            continue
+        gap = threshold - candidate_threshold
+        if best_gap is None or gap < best_gap:
+            best, best_gap = (bands, rows), gap
+    return best
+
+def replace_path(text, old_path, new_path):
+    if old_path and new_path and old_path != new_path:
+        # Only whole paths are replaced, so a.py neither rewrites data.py nor a.py.bak
+        pattern = re.compile(r'(?<![\w./\\-])' + re.escape(old_path) + r'(?![\w/\\-]|\.\w)')
+        return pattern.sub(lambda match: new_path, text)
+    return text
+
+class NearDuplicateIndex:
+    """MinHash signatures of document bodies with LSH banding, so a near-identical document is found without comparing against every other one"""
+
+    def __init__(self, threshold=0.9, num_perm=NUM_PERM, shingle_words=SHINGLE_WORDS):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        generator = random.Random(1)
+        # An empty bin copies the first filled bin in its own fixed random order, so equal documents stay equal
+        self.fill_orders = [generator.sample(range(num_perm), num_perm) for _ in range(num_perm)]
+        self.buckets = [{} for _ in range(self.bands)]
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def signature(self, content):
+        words = strip_header(content).split()
+        if not words:
+            return None
+        size = min(self.shingle_words, len(words))
+        # One permutation hashing: every shingle is hashed once into one of num_perm bins that keep their minimum,
+        # which costs one hash per shingle instead of one per shingle and permutation
+        bins = [None] * self.num_perm
+        for i in range(len(words) - size + 1):
+            h = int.from_bytes(hashlib.blake2b(" ".join(words[i:i + size]).encode('utf-8'), digest_size=8).digest(), 'big')
+            index, value = h % self.num_perm, h // self.num_perm
+            if bins[index] is None or value < bins[index]:
+                bins[index] = value
+        signature = []
+        for index, value in enumerate(bins):
+            if value is None:
+                value = next(bins[other] for other in self.fill_orders[index] if bins[other] is not None)
+            signature.append(value)
+        return tuple(signature)
+
+    def band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows] for i in range(self.bands)]
+
+    def query(self, signature):
+        """Returns (estimated similarity, value) of the closest indexed document at or above the threshold, or None"""
+        with self.lock:
+            candidates = set()
+            for bucket, key in zip(self.buckets, self.band_keys(signature)):
+                candidates.update(bucket.get(key, ()))
+            best = None
+            for position in candidates:
+                other, value = self.entries[position]
+                similarity = sum(1 for x, y in zip(signature, other) if x == y) / self.num_perm
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, value)
+            return best
+
+    def add(self, signature, value):
+        with self.lock:
+            position = len(self.entries)
+            self.entries.append((signature, value))
+            for bucket, key in zip(self.buckets, self.band_keys(signature)):
+                bucket.setdefault(key, []).append(position)
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import os
+import zlib
+
+csv.field_size_limit(10**9)
+
+TAIL_WINDOW = 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b\x08'
+
+def content_digest(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def build_output_rows(main_content, summary, qna_list):
+    output_rows = [[main_content, f"Summary:\n{summary}"]]
+    for qna in qna_list:
+        output_rows.append([main_content, qna])
+    return output_rows
+
+class CsvOutput:
+    """Legacy two-column output: the document is repeated next to its summary and every Q&A pair"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+
+    def write(self, digest, main_content, summary, qna_list):
+        self.writer.writerows(build_output_rows(main_content, summary, qna_list))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def gzip_member_end(data, position):
+    decompressor = zlib.decompressobj(wbits=31)
+    try:
+        decompressor.decompress(data[position:])
+    except zlib.error:
+        return None
+    if not decompressor.eof:
+        return None
+    return len(data) - len(decompressor.unused_data)
+
+def complete_gzip_length(f, size):
+    # Members are found by their header bytes and only count if they decompress with a valid checksum,
+    # so header bytes that happen to occur inside compressed data are never mistaken for a boundary
+    window = TAIL_WINDOW
+    while True:
+        start = max(0, size - window)
+        f.seek(start)
+        data = f.read(size - start)
+        position = len(data)
+        while position > 0:
+            position = data.rfind(GZIP_MAGIC, 0, position)
+            if position == -1:
+                break
+            end = gzip_member_end(memoryview(data), position)
+            if end is not None:
+                return start + end
+        if start == 0:
+            return 0
+        window *= 2
+
+def complete_jsonl_length(f, size):
+    position = size
+    while position > 0:
+        start = max(0, position - TAIL_WINDOW)
+        f.seek(start)
+        index = f.read(position - start).rfind(b'\n')
+        if index != -1:
+            return start + index + 1
+        position = start
+    return 0
+
+def truncate_partial_record(path, compress):
+    # A run killed mid-write leaves half a record, which would swallow the next record appended after it
+    with open(path, 'r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        complete = complete_gzip_length(f, size) if compress else complete_jsonl_length(f, size)
+        if complete < size:
+            print(f"Removing a partial record at the end of {path}")
+            f.truncate(complete)
+
+class JsonlOutput:
+    """One JSON record per document, stored once under its content ID together with its summary and Q&A pairs"""
+
+    def __init__(self, path):
+        self.compress = path.endswith('.gz')
+        if os.path.exists(path):
+            truncate_partial_record(path, self.compress)
+        if self.compress:
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, digest, main_content, summary, qna_list):
+        line = json.dumps({"id": digest, "content": main_content, "summary": summary, "qna": qna_list}, ensure_ascii=False) + "\n"
+        if self.compress:
+            # Each record is its own gzip member, so an interrupted run only loses the record being written
+            self.file.write(gzip.compress(line.encode('utf-8')))
+        else:
+            self.file.write(line)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def open_output(path, output_format):
+    if output_format == "jsonl":
+        return JsonlOutput(path)
+    return CsvOutput(path)
+
+def read_records(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping a damaged record in {path}")
+        except EOFError:
+            print(f"Ignoring a truncated record at the end of {path}")
+
+def read_documents(path, output_format):
+    """Yields (content, summary, Q&A list) for every document already in an output file"""
+    if output_format == "jsonl":
+        for record in read_records(path):
+            yield record['content'], record['summary'], record['qna']
+        return
+
+    # A CSV document is its summary row followed by its Q&A rows, all carrying the same content
+    current = None
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            if row[1].startswith("Summary:\n"):
+                if current is not None:
+                    yield current
+                current = (row[0], row[1][len("Summary:\n"):], [])
+            elif current is not None and row[0] == current[0]:
+                current[2].append(row[1])
+    if current is not None:
+        yield current
+
+def read_input_digests(path):
+    """Digests of the documents in a parser CSV, in input order and without repeats"""
+    digests = []
+    seen = set()
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            digest = content_digest(row[0])
+            if digest not in seen:
+                seen.add(digest)
+                digests.append(digest)
+    return digests
+
+def read_output_digests(path, output_format):
+    if output_format == "jsonl":
+        return {record['id'] for record in read_records(path)}
+    with open(path, 'r', newline='', encoding='utf-8') as outfile:
+        return {content_digest(row[0]) for row in csv.reader(outfile)}
+
+def export_csv(input_path, output_path):
+    count = 0
+    with open(output_path, 'w', newline='', encoding='utf-8') as outfile:
+        writer = csv.writer(outfile)
+        for record in read_records(input_path):
+            writer.writerows(build_output_rows(record['content'], record['summary'], record['qna']))
+            count += 1
+    return count
+
+def export_parquet(input_path, output_path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet export needs pyarrow: pip install pyarrow")
+
+    records = list(read_records(input_path))
+    table = pa.table({
+        "id": [record['id'] for record in records],
+        "content": [record['content'] for record in records],
+        "summary": [record['summary'] for record in records],
+        "qna": [record['qna'] for record in records],
+    })
+    pq.write_table(table, output_path, compression="zstd")
+    return len(records)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export summarizer JSONL output to the legacy two-column CSV or to Parquet.")
+    parser.add_argument("input_path", help="JSONL file written by summarizer.py --output-format jsonl (.gz for compressed)")
+    parser.add_argument("output_path", help="CSV file to write, or a .parquet file")
+    args = parser.parse_args()
+
+    if args.output_path.endswith('.parquet'):
+        count = export_parquet(args.input_path, args.output_path)
+    else:
+        count = export_csv(args.input_path, args.output_path)
+    print(f"Exported {count} documents to {args.output_path}")
+
+if __name__ == "__main__":
+    main()
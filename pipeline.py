@@ -0,0 +1,288 @@
+import argparse
+import os
+import queue
+import threading
+import time
+import requests
+import openai
+import github_ingest
+import qdrant_index
+import summarizer
+from backend_pool import add_backend_arguments
+from metrics import add_metrics_arguments, metrics
+from local_parser import MAX_FILE_SIZE, process_local_repo
+from output_format import build_output_rows, content_digest, open_output
+from response_cache import ResponseCache
+
+QUEUE_SIZE = 32
+STOP = object()
+
+def iter_source(args):
+    # A local checkout is walked like local_parser.py; anything else is fetched like the GitHub scripts
+    if os.path.isdir(args.source):
+        for row in process_local_repo(args.source, args.max_size or MAX_FILE_SIZE, args.exclude, max_workers=args.fetch_workers):
+            yield row['FormattedContent']
+        return
+
+    filters = []
+    if args.extensions:
+        filters.append(github_ingest.ExtensionFilter(args.extensions))
+    if args.exclude:
+        filters.append(github_ingest.ExcludeFolderFilter(args.exclude))
+    if args.skip_regex:
+        filters.append(github_ingest.RegexFilter(args.skip_regex))
+    if args.max_size is not None:
+        filters.append(github_ingest.MaxSizeFilter(args.max_size))
+    yield from github_ingest.iter_ingest(
+        args.source, filters, args.header, args.mode, args.fetch_workers, args.cache_dir,
+        checkpoint_file=args.summary_path + ".fetched", fetch=args.fetch,
+    )
+
+class Pipeline:
+    """Runs fetch, summarize and embed as concurrent stages joined by bounded queues"""
+
+    def __init__(self, args):
+        self.args = args
+        self.documents = queue.Queue(maxsize=args.queue_size)
+        self.summaries = queue.Queue(maxsize=args.queue_size)
+        self.lock = threading.Lock()
+        self.seen_digests = set()
+        self.processed_digests = summarizer.load_processed_contents(args.summary_path, args.output_format)
+        self.fetch_complete = False
+        self.summarize_failed = False
+        self.embed_failed = False
+        self.summarizers_left = args.summarize_workers
+        self.stats = {"fetched": 0, "summarized": 0, "resumed": 0, "skipped": 0, "upserted": 0, "deleted": 0}
+
+        self.embed_enabled = not args.no_embed
+        if self.embed_enabled:
+            self.session = requests.Session()
+            self.client = openai.OpenAI(base_url=qdrant_index.EMBEDDING_API_BASE_URL, api_key=qdrant_index.API_KEY)
+            qdrant_index.ensure_collection(self.session, args.vector_size)
+            self.existing_ids = qdrant_index.existing_point_ids(self.session)
+            print(f"Collection '{qdrant_index.COLLECTION_NAME}' holds {len(self.existing_ids)} points.")
+
+    def fetch_stage(self):
+        try:
+            for document in iter_source(self.args):
+                if self.summarize_failed:
+                    return
+                self.stats["fetched"] += 1
+                # Blocks while the summarizers are behind, so fetching never runs far ahead of them
+                with metrics.timer("pipeline_queue_wait_seconds", stage="fetch"):
+                    self.documents.put(document)
+            self.fetch_complete = True
+        except Exception as e:
+            print(f"Fetch stage failed, finishing the documents already fetched: {e}")
+        finally:
+            for _ in range(self.args.summarize_workers):
+                self.documents.put(STOP)
+
+    def summarize_document(self, document, output, checkpoint):
+        digest = content_digest(document)
+        with self.lock:
+            if digest in self.seen_digests:
+                return
+            self.seen_digests.add(digest)
+            if digest in self.processed_digests:
+                self.stats["resumed"] += 1
+                return
+
+        try:
+            summary, qna_list = summarizer.process_row(document, self.args.answer_workers, self.args.batch_answers,
+                                                       self.args.chunk_tokens)
+        except Exception as e:
+            print(f"Error summarizing document {digest[:12]}: {str(e)}")
+            self.stats["skipped"] += 1
+            return
+
+        with self.lock, metrics.timer("output_write_seconds", format=self.args.output_format):
+            output.write(digest, document, summary, qna_list)
+            checkpoint.write(f"{digest}\n")
+            checkpoint.flush()
+            self.stats["summarized"] += 1
+            print(f"Summarized document {self.stats['summarized']}")
+        with metrics.timer("pipeline_queue_wait_seconds", stage="summarize"):
+            self.summaries.put((digest, document, summary, qna_list))
+
+    def summarize_stage(self, output, checkpoint):
+        try:
+            while True:
+                document = self.documents.get()
+                if document is STOP:
+                    break
+                if self.summarize_failed:
+                    # Keep draining so the fetch stage never blocks on a stage that has stopped
+                    continue
+                try:
+                    self.summarize_document(document, output, checkpoint)
+                except Exception as e:
+                    print(f"Summarize stage failed, the next run resumes from the checkpoint: {e}")
+                    self.summarize_failed = True
+        finally:
+            # The embed stage only stops once every summarizer has exited, however it exited
+            with self.lock:
+                self.summarizers_left -= 1
+                last = self.summarizers_left == 0
+            if last:
+                self.summaries.put(STOP)
+
+    def upsert(self, batch):
+        try:
+            qdrant_index.upsert_batch(self.session, self.client, batch)
+        except (requests.exceptions.RequestException, openai.APIError) as e:
+            print(f"Embed stage failed, the next run will catch up: {e}")
+            self.embed_failed = True
+            return
+        self.existing_ids.update(pid for pid, _, _, _ in batch)
+        self.stats["upserted"] += len(batch)
+        print(f"Upserted {self.stats['upserted']} points...")
+
+    def embed_stage(self):
+        batch = []
+        while True:
+            item = self.summaries.get()
+            if item is STOP:
+                break
+            if not self.embed_enabled or self.embed_failed:
+                # Keep draining so the summarizers never block on a stage that has stopped
+                continue
+
+            try:
+                digest, document, summary, qna_list = item
+                for main_content, text in build_output_rows(document, summary, qna_list):
+                    pid = qdrant_index.point_id(digest, text)
+                    if pid not in self.existing_ids:
+                        batch.append((pid, digest, main_content, text))
+                if len(batch) >= self.args.batch_size:
+                    self.upsert(batch)
+                    batch = []
+            except Exception as e:
+                print(f"Embed stage failed, the next run will catch up: {e}")
+                self.embed_failed = True
+
+        if batch and self.embed_enabled and not self.embed_failed:
+            try:
+                self.upsert(batch)
+            except Exception as e:
+                print(f"Embed stage failed, the next run will catch up: {e}")
+                self.embed_failed = True
+
+    def reconcile(self):
+        # Rows summarized by an earlier run were not streamed through the embed stage, so pick up any that are missing
+        wanted = set()
+        batch = []
+        for row in qdrant_index.read_summary_rows(self.args.summary_path):
+            pid, document_id = row[0], row[1]
+            if document_id not in self.seen_digests or pid in wanted:
+                continue
+            wanted.add(pid)
+            if pid not in self.existing_ids:
+                batch.append(row)
+                if len(batch) >= self.args.batch_size:
+                    self.upsert(batch)
+                    batch = []
+        if batch:
+            self.upsert(batch)
+        if self.embed_failed:
+            return
+
+        # Without a complete listing it is unknown which files were removed, so nothing is deleted
+        if self.fetch_complete:
+            stale = self.existing_ids - wanted
+            qdrant_index.delete_points(self.session, stale)
+            self.stats["deleted"] = len(stale)
+        if not self.args.no_snapshot:
+            qdrant_index.create_snapshot(self.session)
+
+    def run(self):
+        args = self.args
+        output = open_output(args.summary_path, args.output_format)
+        try:
+            with open(summarizer.checkpoint_path(args.summary_path), 'a', encoding='utf-8') as checkpoint:
+                threads = [threading.Thread(target=self.fetch_stage, daemon=True),
+                           threading.Thread(target=self.embed_stage, daemon=True)]
+                threads += [threading.Thread(target=self.summarize_stage, args=(output, checkpoint), daemon=True)
+                            for _ in range(args.summarize_workers)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    while thread.is_alive():
+                        thread.join(0.5)
+        finally:
+            output.close()
+
+        if self.summarize_failed:
+            print("Skipping the Qdrant sync because the summarize stage failed.")
+        elif self.embed_enabled and not self.embed_failed:
+            self.reconcile()
+        fetched_checkpoint = args.summary_path + ".fetched"
+        if self.fetch_complete and os.path.exists(fetched_checkpoint):
+            os.remove(fetched_checkpoint)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch, summarize and embed a repository as one streaming pipeline.")
+    parser.add_argument("source", help="GitHub repository URL, or path to a local checkout")
+    parser.add_argument("summary_path", help="Summary output file, appended to and resumed like summarizer.py's output")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Maximum items waiting between two stages")
+
+    fetch = parser.add_argument_group("fetch")
+    fetch.add_argument("--mode", choices=["tree", "contents", "archive"], default="tree", help="GitHub listing mode, as in the parser scripts")
+    fetch.add_argument("--fetch", choices=["raw", "graphql"], default="raw", help="GitHub download backend, as in the parser scripts")
+    fetch.add_argument("--fetch-workers", type=int, default=github_ingest.MAX_WORKERS, help="Number of files downloaded or read concurrently")
+    fetch.add_argument("--cache-dir", default=None, help="Directory for the GitHub blob and listing cache")
+    fetch.add_argument("--extensions", nargs='*', default=[], help="Only keep files with these extensions, e.g. .md .py")
+    fetch.add_argument("--exclude", nargs='*', default=[], help="Folder names (GitHub) or .gitignore-style patterns (local) to skip")
+    fetch.add_argument("--skip-regex", default=None, help="Regex of folder or file paths to skip (GitHub)")
+    fetch.add_argument("--max-size", type=int, default=None, help="Skip files larger than this many bytes")
+    fetch.add_argument("--header", default=github_ingest.DEFAULT_HEADER, help="Text placed before each GitHub file's path, e.g. \"The following is a markdown document located at\" to match md_file.py; changing it changes every document's digest")
+
+    summarize = parser.add_argument_group("summarize")
+    summarize.add_argument("--summarize-workers", type=int, default=1, help="Number of documents summarized concurrently")
+    summarize.add_argument("--answer-workers", type=int, default=1, help="Number of LLM calls run concurrently within a document")
+    summarize.add_argument("--batch-answers", action="store_true", help="Answer all questions of a document in a single request")
+    summarize.add_argument("--chunk-tokens", type=int, default=summarizer.CHUNK_TOKENS, help="Approximate token size of the chunks large files are split into")
+    summarize.add_argument("--cache-path", default=None, help="SQLite file used to cache LLM responses across runs")
+    summarize.add_argument("--cache-max-mb", type=int, default=1024, help="Maximum size of the LLM response cache")
+    summarize.add_argument("--output-format", choices=["csv", "jsonl"], default="csv", help="Format of the summary output, as in summarizer.py")
+    add_backend_arguments(summarize)
+
+    embed = parser.add_argument_group("embed")
+    embed.add_argument("--no-embed", action="store_true", help="Stop after summarizing")
+    embed.add_argument("--qdrant-url", default=qdrant_index.QDRANT_URL, help="Base URL of the Qdrant REST API")
+    embed.add_argument("--collection", default=qdrant_index.COLLECTION_NAME, help="Collection to sync")
+    embed.add_argument("--embedding-url", default=qdrant_index.EMBEDDING_API_BASE_URL, help="OpenAI-compatible API that serves the embedding model")
+    embed.add_argument("--embedding-model", default=qdrant_index.EMBEDDING_MODEL, help="Embedding model name")
+    embed.add_argument("--vector-size", type=int, default=qdrant_index.VECTOR_SIZE, help="Vector size used when the collection has to be created")
+    embed.add_argument("--batch-size", type=int, default=qdrant_index.BATCH_SIZE, help="Rows embedded and upserted per request")
+    embed.add_argument("--no-snapshot", action="store_true", help="Skip the snapshot after syncing")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    qdrant_index.QDRANT_URL = args.qdrant_url.rstrip('/')
+    qdrant_index.COLLECTION_NAME = args.collection
+    qdrant_index.EMBEDDING_API_BASE_URL = args.embedding_url
+    qdrant_index.EMBEDDING_MODEL = args.embedding_model
+    summarizer.configure_backends(args)
+    if args.cache_path:
+        summarizer.response_cache = ResponseCache(args.cache_path, args.cache_max_mb * 1024 * 1024)
+
+    start = time.time()
+    pipeline = None
+    try:
+        pipeline = Pipeline(args)
+        pipeline.run()
+    except KeyboardInterrupt:
+        print("Process interrupted by user. Progress saved.")
+    except requests.exceptions.HTTPError as e:
+        print(f"HTTP Error occurred: {e}")
+    finally:
+        if pipeline is not None:
+            stats = pipeline.stats
+            print(f"Fetched {stats['fetched']} documents, summarized {stats['summarized']}, resumed {stats['resumed']}, "
+                  f"skipped {stats['skipped']}, upserted {stats['upserted']} points, deleted {stats['deleted']} points "
+                  f"in {time.time() - start:.1f}s.")
+        metrics.write(args.metrics_json, args.metrics_prom)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import openai
+import argparse
+import csv
+import hashlib
+import requests
+import uuid
+from metrics import add_metrics_arguments, metrics
+from output_format import build_output_rows, content_digest, read_input_digests, read_records
+
+csv.field_size_limit(10**9)
+
+QDRANT_URL = "http://localhost:6333"
+COLLECTION_NAME = "default"
+VECTOR_SIZE = 768
+EMBEDDING_API_BASE_URL = "http://localhost:8080/v1"
+EMBEDDING_MODEL = "nomic-embed-text-v1.5"
+API_KEY = "GAIA"
+BATCH_SIZE = 64
+SCROLL_LIMIT = 1000
+
+def point_id(document_id, text):
+    # The same document and row text always map to the same point, so unchanged rows are never re-embedded
+    digest = hashlib.sha256(f"{document_id}\0{text}".encode('utf-8')).hexdigest()
+    return str(uuid.UUID(hex=digest[:32]))
+
+def read_summary_rows(summary_path):
+    """Yields (point ID, document ID, source text, embedded text) for every summary and Q&A row"""
+    if summary_path.endswith(('.jsonl', '.jsonl.gz')):
+        for record in read_records(summary_path):
+            for main_content, text in build_output_rows(record['content'], record['summary'], record['qna']):
+                yield point_id(record['id'], text), record['id'], main_content, text
+        return
+
+    with open(summary_path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            document_id = content_digest(row[0])
+            yield point_id(document_id, row[1]), document_id, row[0], row[1]
+
+def qdrant_request(session, method, path, **kwargs):
+    response = session.request(method, f"{QDRANT_URL}{path}", **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+def ensure_collection(session, vector_size):
+    response = session.get(f"{QDRANT_URL}/collections/{COLLECTION_NAME}")
+    if response.status_code == 200:
+        return
+    print(f"Creating collection '{COLLECTION_NAME}'...")
+    qdrant_request(session, "PUT", f"/collections/{COLLECTION_NAME}", json={
+        "vectors": {"size": vector_size, "distance": "Cosine", "on_disk": True}
+    })
+
+def existing_point_ids(session):
+    ids = set()
+    offset = None
+    while True:
+        body = {"limit": SCROLL_LIMIT, "with_payload": False, "with_vector": False}
+        if offset is not None:
+            body["offset"] = offset
+        result = qdrant_request(session, "POST", f"/collections/{COLLECTION_NAME}/points/scroll", json=body)['result']
+        ids.update(str(point['id']) for point in result['points'])
+        offset = result.get('next_page_offset')
+        if offset is None:
+            return ids
+
+def embed(client, texts):
+    with metrics.timer("embed_request_seconds"):
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        metrics.inc("embed_tokens_total", usage.prompt_tokens or 0)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def upsert_batch(session, client, batch):
+    vectors = embed(client, [text for _, _, _, text in batch])
+    points = [
+        {"id": pid, "vector": vector, "payload": {"source": source, "document_id": document_id}}
+        for (pid, document_id, source, _), vector in zip(batch, vectors)
+    ]
+    with metrics.timer("qdrant_request_seconds", op="upsert"):
+        qdrant_request(session, "PUT", f"/collections/{COLLECTION_NAME}/points?wait=true", json={"points": points})
+    metrics.inc("qdrant_points_total", len(points), op="upsert")
+
+def delete_points(session, ids, batch_size=SCROLL_LIMIT):
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        with metrics.timer("qdrant_request_seconds", op="delete"):
+            qdrant_request(session, "POST", f"/collections/{COLLECTION_NAME}/points/delete?wait=true",
+                           json={"points": ids[start:start + batch_size]})
+    metrics.inc("qdrant_points_total", len(ids), op="delete")
+
+def create_snapshot(session):
+    result = qdrant_request(session, "POST", f"/collections/{COLLECTION_NAME}/snapshots")['result']
+    print(f"Snapshot created: {result.get('name')}")
+
+def sync_collection(summary_path, batch_size=BATCH_SIZE, vector_size=VECTOR_SIZE, snapshot=True, input_path=None):
+    session = requests.Session()
+    client = openai.OpenAI(base_url=EMBEDDING_API_BASE_URL, api_key=API_KEY)
+
+    ensure_collection(session, vector_size)
+    existing = existing_point_ids(session)
+    print(f"Collection '{COLLECTION_NAME}' holds {len(existing)} points.")
+
+    # The summary output is only ever appended to, so it still holds rows of removed files and of old versions of
+    # changed files; the parser CSV of the current run says which documents are still live
+    live_documents = set(read_input_digests(input_path)) if input_path else None
+
+    wanted = set()
+    batch = []
+    upserted = 0
+    for row in read_summary_rows(summary_path):
+        pid, document_id = row[0], row[1]
+        if pid in wanted or (live_documents is not None and document_id not in live_documents):
+            continue
+        wanted.add(pid)
+        if pid in existing:
+            continue
+        batch.append(row)
+        if len(batch) >= batch_size:
+            upsert_batch(session, client, batch)
+            upserted += len(batch)
+            print(f"Upserted {upserted} points...")
+            batch = []
+    if batch:
+        upsert_batch(session, client, batch)
+        upserted += len(batch)
+
+    # Stale points are only removed after the new ones are in, so the collection is never left empty
+    removed = existing - wanted
+    delete_points(session, removed)
+    print(f"Upserted {upserted} new or changed points, deleted {len(removed)} stale points, kept {len(wanted) - upserted}.")
+
+    if snapshot:
+        create_snapshot(session)
+
+def main():
+    global QDRANT_URL, COLLECTION_NAME, EMBEDDING_API_BASE_URL, EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description="Incrementally sync summarizer output into a Qdrant collection.")
+    parser.add_argument("summary_path", help="Summary CSV, or JSONL written with --output-format jsonl")
+    parser.add_argument("--qdrant-url", default=QDRANT_URL, help="Base URL of the Qdrant REST API")
+    parser.add_argument("--collection", default=COLLECTION_NAME, help="Collection to sync")
+    parser.add_argument("--embedding-url", default=EMBEDDING_API_BASE_URL, help="OpenAI-compatible API that serves the embedding model")
+    parser.add_argument("--embedding-model", default=EMBEDDING_MODEL, help="Embedding model name")
+    parser.add_argument("--input", dest="input_path", default=None, help="Parser CSV the summaries were made from; only its documents are kept in the collection, so points of removed and changed files are deleted")
+    parser.add_argument("--vector-size", type=int, default=VECTOR_SIZE, help="Vector size used when the collection has to be created")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows embedded and upserted per request")
+    parser.add_argument("--no-snapshot", action="store_true", help="Skip the snapshot after syncing")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    QDRANT_URL = args.qdrant_url.rstrip('/')
+    COLLECTION_NAME = args.collection
+    EMBEDDING_API_BASE_URL = args.embedding_url
+    EMBEDDING_MODEL = args.embedding_model
+
+    try:
+        sync_collection(args.summary_path, args.batch_size, args.vector_size, not args.no_snapshot, args.input_path)
+    except requests.exceptions.HTTPError as e:
+        print(f"Qdrant request failed: {e}")
+    except openai.APIError as e:
+        print(f"Embedding request failed: {e}")
+    finally:
+        metrics.write(args.metrics_json, args.metrics_prom)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
-import openai
+import argparse
 import csv
+import json
 import os
-import sys
 import logging
-import time
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from backend_pool import BackendPool, add_backend_arguments, parse_endpoint
+from metrics import add_metrics_arguments, metrics
+from near_duplicate import NearDuplicateIndex, extract_path, replace_path
+from output_format import content_digest, open_output, read_documents, read_output_digests
+from response_cache import ResponseCache
 
 csv.field_size_limit(10**9)
 
@@ -12,33 +18,60 @@ API_BASE_URL = "https://llama3b.gaia.domains/v1"
 MODEL_NAME = "llama3b"
 API_KEY = "GAIA"
 
+MAX_CONTENT_CHARS = 32000
+CHUNK_TOKENS = 8000
+CHARS_PER_TOKEN = 4
+# Markdown headings and top-level Python definitions are the preferred places to cut a large file
+BOUNDARY_PATTERN = re.compile(r'^(#{1,6}\s|(async\s+)?def\s|class\s|@)')
+
+response_cache = None
+backend_pool = None
+backend_pool_lock = threading.Lock()
+
 class ProcessingError(Exception):
     """Custom exception for processing failures after retries"""
     pass
 
-def create_retry_decorator():
-    def after_retry(retry_state):
-        if retry_state.attempt_number >= 2: 
-            raise ProcessingError("Failed to process after maximum retries")
-        print(f"Retry attempt {retry_state.attempt_number} after {retry_state.outcome.exception()}")
-
-    return retry(
-        retry=retry_if_exception_type((openai.APIError, openai.APITimeoutError)),
-        stop=stop_after_attempt(2),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        before_sleep=after_retry
-    )
+def get_backend_pool():
+    global backend_pool
+    with backend_pool_lock:
+        if backend_pool is None:
+            backend_pool = BackendPool([(API_BASE_URL, MODEL_NAME)], API_KEY)
+        return backend_pool
 
-@create_retry_decorator()
-def make_api_call(client, messages, model):
-    return client.chat.completions.create(
-        messages=messages,
-        model=model,
-        stream=False,
-    )
+def configure_backends(args):
+    global backend_pool
+    endpoints = [parse_endpoint(value, MODEL_NAME) for value in args.endpoints] or [(API_BASE_URL, MODEL_NAME)]
+    backend_pool = BackendPool(endpoints, API_KEY, args.hedge_after, args.max_attempts)
+    if len(endpoints) > 1:
+        print(f"Spreading LLM calls over {len(endpoints)} endpoints")
+
+def make_api_call(messages):
+    pool = get_backend_pool()
+    if response_cache is not None:
+        key = ResponseCache.make_key(pool.cache_model, messages)
+        cached = response_cache.get(key)
+        if cached is not None:
+            metrics.inc("llm_calls_total", result="cached")
+            return cached
+
+    try:
+        chat_completion = pool.complete(messages)
+    except Exception as e:
+        metrics.inc("llm_calls_total", result="error")
+        raise ProcessingError(f"Failed to process after maximum retries: {e}") from e
+    content = chat_completion.choices[0].message.content
+    metrics.inc("llm_calls_total", result="ok")
+    usage = getattr(chat_completion, 'usage', None)
+    if usage is not None:
+        metrics.inc("llm_tokens_total", usage.prompt_tokens or 0, kind="prompt")
+        metrics.inc("llm_tokens_total", usage.completion_tokens or 0, kind="completion")
+
+    if response_cache is not None:
+        response_cache.put(key, content)
+    return content
 
 def summarize(source_text):
-    client = openai.OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
     messages = [
         {
             "role": "system",
@@ -61,11 +94,9 @@ def summarize(source_text):
             "content": source_text,
         }
     ]
-    chat_completion = make_api_call(client, messages, MODEL_NAME)
-    return chat_completion.choices[0].message.content
+    return make_api_call(messages)
 
 def qgen(source_text):
-    client = openai.OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
     messages = [
         {
             "role": "system",
@@ -76,11 +107,9 @@ def qgen(source_text):
             "content": source_text,
         }
     ]
-    chat_completion = make_api_call(client, messages, MODEL_NAME)
-    return chat_completion.choices[0].message.content
+    return make_api_call(messages)
 
 def agen(source_text, question):
-    client = openai.OpenAI(base_url=API_BASE_URL, api_key=API_KEY)
     messages = [
         {
             "role": "system",
@@ -91,90 +120,462 @@ def agen(source_text, question):
             "content": question,
         }
     ]
-    chat_completion = make_api_call(client, messages, MODEL_NAME)
-    return chat_completion.choices[0].message.content
+    return make_api_call(messages)
+
+def agen_batch(source_text, questions):
+    messages = [
+        {
+            "role": "system",
+            "content": "Give a comprehensive and well-reasoned answer to each of the user questions strictly based on the context below and try to give a detailed explanation while answering the questions. Also try to add some bonus tip to in each answer and some relevant example outside of the content. The questions are given as a JSON array. Respond with only a JSON array of strings containing one answer per question, in the same order as the questions.\n" + source_text
+        },
+        {
+            "role": "user",
+            "content": json.dumps(questions),
+        }
+    ]
+    return parse_answers(make_api_call(messages), len(questions))
+
+def reduce_summaries(summaries):
+    messages = [
+        {
+            "role": "system",
+            "content": "The user message contains summaries of consecutive parts of one file, separated by blank lines. Combine them into a single summary of the whole file. Keep the purpose of the file, its key functions, classes or sections, dependencies, error handling and performance implications, and remove repetition.",
+        },
+        {
+            "role": "user",
+            "content": "\n\n".join(summaries),
+        }
+    ]
+    return make_api_call(messages)
+
+def extract_json_array(response_text):
+    # Models often wrap the array in a code fence or add a sentence around it, so only parse the outermost brackets
+    start = response_text.find('[')
+    end = response_text.rfind(']')
+    if start == -1 or end < start:
+        raise ValueError("No JSON array found in response")
+    return json.loads(response_text[start:end + 1])
+
+def parse_answers(response_text, expected_count):
+    answers = extract_json_array(response_text)
+    if not isinstance(answers, list) or len(answers) != expected_count:
+        raise ValueError(f"Expected {expected_count} answers in batched answer response")
+    return [answer if isinstance(answer, str) else json.dumps(answer) for answer in answers]
+
+def summarize_packed(contents):
+    documents = "\n".join(
+        f"=== DOCUMENT {i} ===\n{content}\n=== END DOCUMENT {i} ===" for i, content in enumerate(contents, start=1)
+    )
+    messages = [
+        {
+            "role": "system",
+            "content": """
+            You are an AI assistant that documents the files of a GitHub repository. The user message contains several files, each placed between a "=== DOCUMENT n ===" line and a "=== END DOCUMENT n ===" line. Treat every document on its own:
+
+            1. Summarize it. For code, capture the purpose of the code, its functions, classes or methods, dependencies, error handling and performance implications. For markdown and other text, extract the key points such as setup, usage instructions, change logs or contributor guidelines.
+            2. Write up to 10 questions that the document answers, each with a comprehensive and well-reasoned answer strictly based on that document.
+
+            Respond with only a JSON array containing one object per document, in this form:
+            [{"document": 1, "summary": "...", "qna": [{"question": "...", "answer": "..."}]}]
+            """,
+        },
+        {
+            "role": "user",
+            "content": documents,
+        }
+    ]
+    return parse_packed(make_api_call(messages), len(contents))
 
-def process_row(row, csv_writer, processed_contents, row_count):
+def parse_packed(response_text, expected_count):
+    results = {}
+    for item in extract_json_array(response_text):
+        qna_list = [f"Q: {qna['question']}\nA: {qna['answer']}" for qna in item.get('qna', [])]
+        results[int(item['document'])] = (str(item['summary']), qna_list)
+    if sorted(results) != list(range(1, expected_count + 1)):
+        raise ValueError(f"Expected results for documents 1 to {expected_count} in packed response")
+    return [results[i] for i in range(1, expected_count + 1)]
+
+def answer_questions(source_text, questions, answer_workers=1, batch_answers=False):
+    if batch_answers and questions:
+        try:
+            return agen_batch(source_text, questions)
+        except (ValueError, TypeError) as e:
+            print(f"Batched answers could not be parsed, answering questions one at a time: {str(e)}")
+
+    if answer_workers <= 1:
+        return [agen(source_text, q) for q in questions]
+    with ThreadPoolExecutor(max_workers=answer_workers) as executor:
+        return list(executor.map(lambda q: agen(source_text, q), questions))
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def split_blocks(text):
+    blocks = []
+    current = []
+    previous = ''
+    for line in text.splitlines(keepends=True):
+        # Keep decorators attached to the definition that follows them
+        if current and BOUNDARY_PATTERN.match(line) and not previous.startswith('@'):
+            blocks.append(''.join(current))
+            current = []
+        current.append(line)
+        previous = line
+    if current:
+        blocks.append(''.join(current))
+    return blocks
+
+def split_oversized(block, max_chars):
+    if len(block) <= max_chars:
+        return [block]
+    pieces = []
+    current = ''
+    for line in block.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = ''
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_into_chunks(text, max_tokens=CHUNK_TOKENS):
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = ''
+    for block in split_blocks(text):
+        for piece in split_oversized(block, max_chars):
+            if current and estimate_tokens(current + piece) > max_tokens:
+                chunks.append(current)
+                current = ''
+            current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def map_parallel(function, items, workers):
+    if workers <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, items))
+
+def generate_qna(source_text, answer_workers=1, batch_answers=False):
+    qs = qgen(source_text)
+    questions = [q for q in qs.splitlines() if len(q.strip()) > 0]
+    answers = answer_questions(source_text, questions, answer_workers, batch_answers)
+    return [f"Q: {q}\nA: {answer}" for q, answer in zip(questions, answers)]
+
+def summarize_large(main_content, answer_workers=1, batch_answers=False, chunk_tokens=CHUNK_TOKENS):
+    # Every chunk keeps the "located at ..." header line so the model knows which file it belongs to
+    header, _, body = main_content.partition('\n')
+    if len(header) > 1000 or not body:
+        header, body = "The following is a document", main_content
+    parts = split_into_chunks(body, chunk_tokens)
+    chunks = [f"{header} (part {i} of {len(parts)})\n{part}" for i, part in enumerate(parts, start=1)]
+    print(f"Splitting {len(main_content)} characters into {len(chunks)} chunks")
+
+    summaries = map_parallel(summarize, chunks, answer_workers)
+    # Reduce in rounds until the combined summaries fit into one request
+    while len(summaries) > 1:
+        groups = [[]]
+        for summary in summaries:
+            if groups[-1] and estimate_tokens("\n\n".join(groups[-1] + [summary])) > chunk_tokens:
+                groups.append([])
+            groups[-1].append(summary)
+        if len(groups) == len(summaries):
+            groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        summaries = map_parallel(reduce_summaries, groups, answer_workers)
+
+    qna_lists = map_parallel(lambda chunk: generate_qna(chunk, 1, batch_answers), chunks, answer_workers)
+    return summaries[0], [qna for qna_list in qna_lists for qna in qna_list]
+
+def process_row(main_content, answer_workers=1, batch_answers=False, chunk_tokens=CHUNK_TOKENS):
+    if len(main_content) > MAX_CONTENT_CHARS:
+        with metrics.timer("summarizer_row_seconds", size="large"):
+            summary, qna_list = summarize_large(main_content, answer_workers, batch_answers, chunk_tokens)
+    else:
+        with metrics.timer("summarizer_row_seconds", size="small"):
+            summary = summarize(main_content)
+            qna_list = generate_qna(main_content, answer_workers, batch_answers)
+
+    return summary, qna_list
+
+def process_rows(contents, answer_workers=1, batch_answers=False, chunk_tokens=CHUNK_TOKENS):
+    # Several small files share one request; any reply that cannot be split per file falls back to one row at a time
+    if len(contents) > 1:
+        try:
+            with metrics.timer("summarizer_pack_seconds"):
+                return summarize_packed(contents)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            metrics.inc("summarizer_pack_fallbacks_total")
+            print(f"Packed response could not be split, processing {len(contents)} rows one at a time: {str(e)}")
+
+    results = []
+    for content in contents:
+        try:
+            results.append(process_row(content, answer_workers, batch_answers, chunk_tokens))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def checkpoint_path(output_path):
+    return output_path + ".done"
+
+def parse_shard(value):
+    index, _, count = value.partition('/')
     try:
-        main_content = row[0]
-
-        if main_content in processed_contents:
-            print(f"Skipping row because content has already been processed")
-            return row_count, 0
-
-        if len(main_content) > 32000:
-            print(f"Skipping row {row_count + 1}: content exceeds 32000 characters")
-            return row_count, 0
-
-        summary = summarize(main_content)
-        qs = qgen(main_content)
-        qna_list = []
-        
-        for q in qs.splitlines():
-            if len(q.strip()) == 0:
-                continue
-            answer = agen(main_content, q)
-            qna_list.append(f"Q: {q}\nA: {answer}")
-
-        csv_writer.writerow([main_content, f"Summary:\n{summary}"])
-        for qna in qna_list:
-            csv_writer.writerow([main_content, qna])
-        
-        processed_contents.add(main_content)
-        row_count += 1
-        print(f"Processed row {row_count}")
-        return row_count, 0
-
-    except ProcessingError as pe:
-        print(f"Skipping row {row_count + 1} due to timeout: {str(pe)}")
-        return row_count, 1
-    except Exception as e:
-        print(f"Error processing row {row_count + 1}: {str(e)}")
-        return row_count, 1
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected INDEX/COUNT, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError("INDEX must be between 0 and COUNT - 1")
+    return index, count
 
+def shard_of(digest, shard_count):
+    # The content hash decides the shard, so every worker agrees on the split without coordinating
+    return int(digest[:16], 16) % shard_count
 
-def load_processed_contents(output_path):
+def shard_path(output_path, index, shard_count):
+    # The shard tag goes before the extension so .jsonl.gz shards are still read and written compressed
+    for extension in ('.jsonl.gz', '.jsonl', '.csv'):
+        if output_path.endswith(extension):
+            return f"{output_path[:-len(extension)]}.shard-{index}-of-{shard_count}{extension}"
+    return f"{output_path}.shard-{index}-of-{shard_count}"
+
+def load_processed_contents(output_path, output_format="csv"):
     processed = set()
-    if os.path.exists(output_path):
-        with open(output_path, 'r', newline='', encoding='utf-8') as outfile:
-            csv_reader = csv.reader(outfile)
-            for row in csv_reader:
-                processed.add(row[0])
+    checkpoint = checkpoint_path(output_path)
+
+    if not os.path.exists(output_path):
+        # A checkpoint without its output file is stale, e.g. after the CSV was rotated away
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        return processed
+
+    if os.path.exists(checkpoint):
+        with open(checkpoint, 'r', encoding='utf-8') as f:
+            processed.update(line.strip() for line in f if line.strip())
+        return processed
+
+    # Output written before checkpoints existed: scan it once and record its digests
+    print(f"Building resume checkpoint from {output_path}...")
+    processed.update(read_output_digests(output_path, output_format))
+    with open(checkpoint, 'w', encoding='utf-8') as f:
+        f.writelines(f"{digest}\n" for digest in processed)
     return processed
 
 def main():
-    if len(sys.argv) != 3:
-        logging.error("Usage: python summarizer.py <input_csv> <output_csv>")
-        sys.exit(1)
-        
-    input_path = sys.argv[1]
-    output_path = sys.argv[2]
-    
-    processed_contents = load_processed_contents(output_path)
+    parser = argparse.ArgumentParser(description="Summarize repository files and generate Q&A pairs.")
+    parser.add_argument("input_path", help="CSV file produced by one of the parsers")
+    parser.add_argument("output_path", help="File to append summaries and Q&A pairs to")
+    parser.add_argument("--workers", type=int, default=1, help="Number of rows processed concurrently")
+    parser.add_argument("--answer-workers", type=int, default=1, help="Number of LLM calls run concurrently within a row, for answers and for the chunks of a large file")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help=f"Approximate token size of the chunks that files over {MAX_CONTENT_CHARS} characters are split into")
+    parser.add_argument("--cache-path", default=None, help="SQLite file used to cache LLM responses across runs")
+    parser.add_argument("--cache-max-mb", type=int, default=1024, help="Maximum size of the LLM response cache before the least recently used responses are evicted")
+    parser.add_argument("--pack-tokens", type=int, default=0, help="Token budget for packing small files into one request; 0 disables packing")
+    parser.add_argument("--small-file-tokens", type=int, default=500, help="Files up to this many estimated tokens are eligible for packing")
+    parser.add_argument("--pack-max-files", type=int, default=8, help="Maximum number of files packed into one request")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], default="csv", help="Legacy two-column CSV, or JSONL with each document stored once next to its summary and Q&A pairs (gzip-compressed when the path ends in .gz)")
+    parser.add_argument("--batch-answers", action="store_true", help="Answer all questions of a row in a single request, falling back to one request per question if the reply cannot be parsed")
+    parser.add_argument("--near-duplicates", choices=["off", "skip", "reuse"], default="off", help="Skip files that are near-duplicates of one already summarized, or reuse its summary and Q&A with the new path")
+    parser.add_argument("--dedup-threshold", type=float, default=0.9, help="Estimated Jaccard similarity of file bodies at which a file counts as a near-duplicate")
+    parser.add_argument("--shard", type=parse_shard, default=None, help="Only process the rows whose content hash falls in shard INDEX/COUNT (e.g. 0/4), writing them to a per-shard output and checkpoint next to output_path; combine the shards with merge_shards.py")
+    add_backend_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_backends(args)
+
+    input_path = args.input_path
+    output_path = args.output_path
+    if args.shard is not None:
+        output_path = shard_path(output_path, *args.shard)
+        print(f"Processing shard {args.shard[0]} of {args.shard[1]} into {output_path}")
+
+    global response_cache
+    if args.cache_path:
+        response_cache = ResponseCache(args.cache_path, args.cache_max_mb * 1024 * 1024)
+
+    processed_digests = load_processed_contents(output_path, args.output_format)
+
+    dedup_index = None
+    # Index entries of rows still being summarized, by digest, so their near-duplicates can follow them
+    dedup_pending = {}
+    if args.near_duplicates != "off":
+        dedup_index = NearDuplicateIndex(args.dedup_threshold)
+        if os.path.exists(output_path):
+            seeded = 0
+            for content, summary, qna_list in read_documents(output_path, args.output_format):
+                signature = dedup_index.signature(content)
+                if signature is not None:
+                    dedup_index.add(signature, {"path": extract_path(content), "result": (summary, qna_list), "followers": []})
+                    seeded += 1
+            print(f"Near-duplicate index seeded with {seeded} documents from {output_path}")
+    scheduled = set()
     row_count = 0
     skipped_rows = 0
+    write_lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    output = None
 
     try:
         with open(input_path, 'r', newline='', encoding='utf-8') as infile, \
-             open(output_path, 'a', newline='', encoding='utf-8') as outfile:
-            
+             open(checkpoint_path(output_path), 'a', encoding='utf-8') as checkpoint:
+
             csv_reader = csv.reader(infile)
-            csv_writer = csv.writer(outfile)
+            output = open_output(output_path, args.output_format)
+
+            def write_result(digest, main_content, summary, qna_list):
+                nonlocal row_count
+                # All rows of one source row are written together so a resume never sees half of it
+                with write_lock, metrics.timer("output_write_seconds", format=args.output_format):
+                    output.write(digest, main_content, summary, qna_list)
+                    checkpoint.write(f"{digest}\n")
+                    checkpoint.flush()
+                processed_digests.add(digest)
+                metrics.inc("summarizer_qna_pairs_total", len(qna_list))
+                row_count += 1
+                print(f"Processed row {row_count}")
+
+            def reuse_result(entry, row_number, digest, main_content):
+                old_path, new_path = entry["path"], extract_path(main_content)
+                summary, qna_list = entry["result"]
+                print(f"Row {row_number} is a near-duplicate of {old_path}, reusing its summary and Q&A")
+                metrics.inc("summarizer_rows_total", result="near_duplicate")
+                write_result(digest, main_content, replace_path(summary, old_path, new_path),
+                             [replace_path(qna, old_path, new_path) for qna in qna_list])
+
+            def release_followers(digest, result):
+                nonlocal skipped_rows
+                entry = dedup_pending.pop(digest, None)
+                if entry is None:
+                    return
+                entry["result"] = result
+                entry["failed"] = result is None
+                followers, entry["followers"] = entry["followers"], []
+                for row_number, follower_digest, main_content in followers:
+                    if result is None:
+                        print(f"Skipping row {row_number} because the row it duplicates failed")
+                        scheduled.discard(follower_digest)
+                        skipped_rows += 1
+                    else:
+                        reuse_result(entry, row_number, follower_digest, main_content)
+
+            def finish_rows(future, rows):
+                nonlocal skipped_rows
+                try:
+                    results = future.result()
+                except Exception as e:
+                    results = [e] * len(rows)
+
+                for (row_number, digest, main_content), result in zip(rows, results):
+                    if isinstance(result, ProcessingError):
+                        print(f"Skipping row {row_number} due to timeout: {str(result)}")
+                        metrics.inc("summarizer_rows_total", result="timeout")
+                        skipped_rows += 1
+                        release_followers(digest, None)
+                        continue
+                    if isinstance(result, Exception):
+                        print(f"Error processing row {row_number}: {str(result)}")
+                        metrics.inc("summarizer_rows_total", result="error")
+                        skipped_rows += 1
+                        release_followers(digest, None)
+                        continue
+
+                    summary, qna_list = result
+                    metrics.inc("summarizer_rows_total", result="processed")
+                    write_result(digest, main_content, summary, qna_list)
+                    release_followers(digest, result)
+
+            in_flight = {}
+
+            def submit(batch):
+                contents = [content for _, _, content in batch]
+                future = executor.submit(process_rows, contents, args.answer_workers, args.batch_answers, args.chunk_tokens)
+                in_flight[future] = batch
+
+                # Keep a bounded number of rows queued so large inputs are not read into memory up front
+                if len(in_flight) >= args.workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish_rows(future, in_flight.pop(future))
+
+            pack = []
+            pack_tokens = 0
+            for row_number, row in enumerate(csv_reader, start=1):
+                if not row:
+                    continue
+                main_content = row[0]
+                digest = content_digest(main_content)
+                if args.shard is not None and shard_of(digest, args.shard[1]) != args.shard[0]:
+                    continue
+
+                if digest in processed_digests or digest in scheduled:
+                    print(f"Skipping row because content has already been processed")
+                    metrics.inc("summarizer_rows_total", result="resumed")
+                    continue
+                scheduled.add(digest)
+
+                if dedup_index is not None:
+                    signature = dedup_index.signature(main_content)
+                    match = dedup_index.query(signature) if signature is not None else None
+                    # A neighbour whose own summarization failed is no use, so the row is then processed normally
+                    if match is not None and not match[1].get("failed"):
+                        similarity, entry = match
+                        if args.near_duplicates == "skip":
+                            print(f"Skipping row {row_number}: {similarity:.0%} similar to {entry['path']}")
+                            metrics.inc("summarizer_rows_total", result="near_duplicate_skipped")
+                            continue
+                        if entry["result"] is not None:
+                            reuse_result(entry, row_number, digest, main_content)
+                        else:
+                            entry["followers"].append((row_number, digest, main_content))
+                        continue
+                    if signature is not None:
+                        entry = {"path": extract_path(main_content), "result": None, "followers": []}
+                        dedup_index.add(signature, entry)
+                        dedup_pending[digest] = entry
+
+                tokens = estimate_tokens(main_content)
+                if args.pack_tokens <= 0 or tokens > args.small_file_tokens:
+                    submit([(row_number, digest, main_content)])
+                    continue
+
+                if pack and (pack_tokens + tokens > args.pack_tokens or len(pack) >= args.pack_max_files):
+                    submit(pack)
+                    pack = []
+                    pack_tokens = 0
+                pack.append((row_number, digest, main_content))
+                pack_tokens += tokens
 
-            for row in csv_reader:
-                row_count, skipped = process_row(row, csv_writer, processed_contents, row_count)
-                skipped_rows += skipped
+            if pack:
+                submit(pack)
 
-                outfile.flush()
+            for future in as_completed(list(in_flight)):
+                finish_rows(future, in_flight.pop(future))
 
     except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
         print("Process interrupted by user. Progress saved.")
     except Exception as e:
         logging.error(f"Unexpected error: {str(e)}")
     finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if output is not None:
+            output.close()
         print(f"Modified data has been written to {output_path}")
         print(f"Total rows summarized: {row_count}")
         print(f"Total rows skipped: {skipped_rows}")
+        if response_cache is not None:
+            print(f"LLM response cache: {response_cache.hits} hits, {response_cache.misses} misses")
+        metrics.write(args.metrics_json, args.metrics_prom)
 
 if __name__ == "__main__":
     main()